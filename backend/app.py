@@ -1,7 +1,9 @@
 
-from flask import Flask, request, send_file
+from flask import Flask, Request, request, send_file, url_for
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import tempfile
 from pathlib import Path
@@ -9,6 +11,11 @@ from datetime import datetime
 import json
 import time
 import subprocess
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Document processing libraries
 from docx import Document
@@ -16,24 +23,89 @@ from docx.shared import Inches, Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from pptx import Presentation
 from pptx.util import Inches as PptxInches, Pt as PptxPt
-from PyPDF2 import PdfMerger, PdfReader
+from pptx.oxml.ns import qn as pptx_qn
+from pptx.shapes.graphfrm import GraphicFrame
+from PyPDF2 import PdfMerger, PdfReader, PdfWriter
+from PyPDF2.generic import AnnotationBuilder, ArrayObject, NameObject
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Image as RLImage, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, Table, TableStyle
+from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib.utils import ImageReader
+from reportlab import rl_config
 from PIL import Image
 import io
+import zipfile
+import shutil
+import re
+import secrets
+import hmac
 
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-UniDoc-Build-Id'])
 
 
 ALLOWED_EXTENSIONS = {'pdf', 'docx', 'doc', 'pptx', 'ppt', 'txt', 'jpg', 'jpeg', 'png', 'gif'}
 TEMP_DIR = tempfile.gettempdir()
 
+# PDF text extraction settings (used by the DOCX/PPTX combiners)
+TEXT_EXTRACT_WORKERS = int(os.environ.get('TEXT_EXTRACT_WORKERS', os.cpu_count() or 1))
+TEXT_EXTRACT_CHUNK_PAGES = 16          # pages handed to a worker per task
+TEXT_EXTRACT_PARALLEL_MIN_PAGES = 32   # smaller PDFs are extracted in-process
+TEXT_CACHE_MAX_PAGES = int(os.environ.get('TEXT_CACHE_MAX_PAGES', 20000))
+PPTX_PAGE_TEXT_BUDGET = 2000           # characters kept per PDF page in PPTX output
+
+# Batch UniDoc settings
+BUILD_WORKERS = int(os.environ.get('BUILD_WORKERS', os.cpu_count() or 1))
+BATCH_MAX_COURSES = int(os.environ.get('BATCH_MAX_COURSES', 100))
+BATCH_OUTPUT_TTL = int(os.environ.get('BATCH_OUTPUT_TTL', 3600))  # seconds download links stay valid
+
+# Incremental UniDoc builds
+UNIDOC_MANIFEST_VERSION = 3
+# Only kept when the client opts in (incremental=1 or previous_build). Each kept build
+# holds a full copy of its output plus manifest on local disk for UNIDOC_BUILD_TTL, on
+# top of the copy handed to a non-inline artifact store: budget roughly
+# (opted-in builds per TTL) x (average UniDoc size) of TEMP_DIR space.
+UNIDOC_BUILD_TTL = int(os.environ.get('UNIDOC_BUILD_TTL', 24 * 3600))  # seconds a build can be reused
+SCRATCH_SWEEP_INTERVAL = int(os.environ.get('SCRATCH_SWEEP_INTERVAL', 600))  # seconds between expired-dir sweeps
+
+# Artifact store: where finished outputs go ('inline', 'local' or 's3')
+ARTIFACT_STORE = os.environ.get('ARTIFACT_STORE', 'inline')
+ARTIFACT_URL_TTL = int(os.environ.get('ARTIFACT_URL_TTL', 900))  # seconds a download URL stays valid
+ARTIFACT_DIR = os.environ.get('ARTIFACT_DIR', os.path.join(TEMP_DIR, 'artifacts'))
+ARTIFACT_S3_BUCKET = os.environ.get('ARTIFACT_S3_BUCKET', '')
+ARTIFACT_S3_PREFIX = os.environ.get('ARTIFACT_S3_PREFIX', 'outputs/')
+ARTIFACT_S3_ENDPOINT_URL = os.environ.get('ARTIFACT_S3_ENDPOINT_URL') or None  # e.g. MinIO/localstack
+ARTIFACT_MULTIPART_CHUNK = 8 * 1024 * 1024
+
+# Reverse proxies in front of the app (Render terminates HTTPS in one). Their
+# X-Forwarded-Proto/Host headers make external download URLs https; 0 trusts none.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 1))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS,
+                            x_host=TRUSTED_PROXY_HOPS, x_port=TRUSTED_PROXY_HOPS)
+
+# PPTX rendering: 'fast' (direct canvas layout) or 'libreoffice' (full fidelity)
+PPTX_RENDERER = os.environ.get('PPTX_RENDERER', 'fast')
+
+# Preview thumbnail settings
+PREVIEW_DEFAULT_SIZE = 160
+PREVIEW_MAX_SIZE = 512
+PREVIEW_CACHE_MAX_BYTES = int(os.environ.get('PREVIEW_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+# Upload ingestion limits
+MAX_UPLOAD_FILE_SIZE = int(os.environ.get('MAX_UPLOAD_FILE_SIZE', 100 * 1024 * 1024))
+MAX_REQUEST_SIZE = int(os.environ.get('MAX_REQUEST_SIZE', 500 * 1024 * 1024))
+MAX_UPLOAD_FILES = int(os.environ.get('MAX_UPLOAD_FILES', 200))
+MAX_FORM_FIELDS_SIZE = 4 * 1024 * 1024   # non-file fields (checklist_data, courses JSON)
+SNIFF_BYTES = 4096
+TEXT_BOMS = (b'\xef\xbb\xbf', b'\xff\xfe', b'\xfe\xff')
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -51,6 +123,161 @@ def get_file_type(filename):
         return 'image'
     return 'unknown'
 
+# UPLOAD INGESTION
+class IngestedUpload:
+    """Write target for one multipart file part.
+
+    Werkzeug streams the part straight into its final scratch file, while the
+    SHA-256 and the leading bytes (for type sniffing) are captured on the way
+    and the per-file size limit is enforced.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.size = 0
+        self.head = b''
+        self._sha256 = hashlib.sha256()
+        self._file = open(path, 'w+b')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise RequestEntityTooLarge(f"File exceeds the {self.max_size // (1024 * 1024)} MB per-file limit")
+        if len(self.head) < SNIFF_BYTES:
+            self.head += data[:SNIFF_BYTES - len(self.head)]
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class IngestingRequest(Request):
+    """Request whose multipart file parts are ingested by IngestedUpload, with count limits"""
+    max_form_parts = MAX_UPLOAD_FILES + 100
+    max_form_memory_size = MAX_FORM_FIELDS_SIZE
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        uploads = self.__dict__.setdefault('ingested_uploads', [])
+        if len(uploads) >= MAX_UPLOAD_FILES:
+            raise RequestEntityTooLarge(f"Too many files (max {MAX_UPLOAD_FILES})")
+        if content_length and content_length > MAX_UPLOAD_FILE_SIZE:
+            raise RequestEntityTooLarge(f"File exceeds the {MAX_UPLOAD_FILE_SIZE // (1024 * 1024)} MB per-file limit")
+
+        name = secure_filename(filename or '') or 'upload'
+        upload = IngestedUpload(os.path.join(TEMP_DIR, f"upload_{time.time_ns()}_{name}"), MAX_UPLOAD_FILE_SIZE)
+        uploads.append(upload)
+        return upload
+
+
+app.request_class = IngestingRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_SIZE
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return {'error': e.description or 'Upload too large'}, 413
+
+_last_scratch_sweep = 0.0
+
+@app.before_request
+def sweep_expired_scratch_dirs():
+    """Every SCRATCH_SWEEP_INTERVAL, drop expired UniDoc builds and batch outputs.
+
+    Runs on whatever request comes in, so expired dirs don't wait for the
+    next /combine-unidoc or batch request to be cleaned up.
+    """
+    global _last_scratch_sweep
+    now = time.time()
+    if now - _last_scratch_sweep < SCRATCH_SWEEP_INTERVAL:
+        return
+    _last_scratch_sweep = now
+    _cleanup_expired_dirs('unidoc_build_', UNIDOC_BUILD_TTL)
+    _cleanup_expired_dirs('unidoc_batch_', BATCH_OUTPUT_TTL)
+
+@app.teardown_request
+def cleanup_ingested_uploads(exc=None):
+    for upload in request.__dict__.get('ingested_uploads', []):
+        try:
+            upload.close()
+            if os.path.exists(upload.path):
+                os.remove(upload.path)
+        except Exception:
+            pass
+
+def detect_file_type(head, path=None, filename=''):
+    """Identify a file from its magic bytes: 'pdf', 'docx', 'pptx', 'image', 'txt' or 'unknown'"""
+    if b'%PDF-' in head[:1024]:
+        return 'pdf'
+    if head.startswith((b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF87a', b'GIF89a')):
+        return 'image'
+    if head.startswith(b'PK\x03\x04'):
+        # OOXML is a ZIP; the part names tell Word from PowerPoint
+        try:
+            with zipfile.ZipFile(path) as zf:
+                names = zf.namelist()
+        except Exception:
+            return 'unknown'
+        if any(n.startswith('word/') for n in names):
+            return 'docx'
+        if any(n.startswith('ppt/') for n in names):
+            return 'pptx'
+        return 'unknown'
+    if head.startswith(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'):
+        # Legacy .doc/.ppt share the OLE2 container, so the extension picks the converter
+        ext_type = get_file_type(filename) if allowed_file(filename) else 'unknown'
+        return ext_type if ext_type in ('docx', 'pptx') else 'unknown'
+    if head and b'\x00' not in head:
+        return 'txt'
+    if allowed_file(filename) and get_file_type(filename) == 'txt' and (not head or head.startswith(TEXT_BOMS)):
+        # Empty .txt files and UTF-16 text (which is full of NUL bytes) are still text
+        return 'txt'
+    return 'unknown'
+
+def text_encoding(path):
+    """Encoding to read a text file with: UTF-16 if it starts with a UTF-16 byte-order mark, else UTF-8"""
+    with open(path, 'rb') as f:
+        bom = f.read(2)
+    return 'utf-16' if bom in (b'\xff\xfe', b'\xfe\xff') else 'utf-8-sig'
+
+def ingest_upload(fs):
+    """Return {'path', 'name', 'type', 'hash', 'size'} for an uploaded FileStorage.
+
+    Parts ingested by IngestingRequest are already on disk, hashed and sniffed,
+    so nothing is copied; any other stream is saved once as a fallback. 'type'
+    comes from the file's content, not its extension.
+    """
+    name = secure_filename(fs.filename)
+    stream = fs.stream
+    if isinstance(stream, IngestedUpload):
+        stream.flush()
+        return {
+            'path': stream.path,
+            'name': name,
+            'type': detect_file_type(stream.head, stream.path, fs.filename),
+            'hash': stream.sha256,
+            'size': stream.size,
+        }
+
+    path = os.path.join(TEMP_DIR, f"{time.time_ns()}_{name}")
+    fs.save(path)
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    return {
+        'path': path,
+        'name': name,
+        'type': detect_file_type(head, path, fs.filename),
+        'hash': file_sha256(path),
+        'size': os.path.getsize(path),
+    }
+
 # HELPER FUNCTIONS FOR UNIDOC
 def create_cover_page(output_path):
     """Create cover page for UniDoc"""
@@ -90,20 +317,55 @@ def create_course_info_page(course_data, output_path):
     c.showPage()
     c.save()
 
-def create_index_page(file_names, output_path):
-    """Create index page"""
+def _index_layout(count):
+    """(page offset, y) of each index entry, matching create_index_page's pagination"""
+    width, height = letter
+    positions = []
+    page = 0
+    y = height - 2.5*inch
+    for _ in range(count):
+        if y < 100:
+            page += 1
+            y = height - inch
+        positions.append((page, y))
+        y -= 25
+    return positions
+
+def index_page_count(count):
+    """Number of pages create_index_page produces for `count` entries"""
+    layout = _index_layout(count)
+    return layout[-1][0] + 1 if layout else 1
+
+def index_link_rects(count):
+    """(page offset, rect) of each index entry's clickable area"""
+    width, height = letter
+    return [(page, (72, y - 4, width - 72, y + 12)) for page, y in _index_layout(count)]
+
+def create_index_page(file_names, output_path, page_numbers=None):
+    """Create index page, optionally with a right-aligned page number per entry"""
     c = canvas.Canvas(output_path, pagesize=letter)
     width, height = letter
     c.setFont("Helvetica-Bold", 20)
     c.drawString(72, height - 1.5*inch, "Table of Contents")
     c.setFont("Helvetica", 11)
-    y = height - 2.5*inch
-    for i, name in enumerate(file_names, 1):
-        if y < 100:
+    current_page = 0
+    for i, (name, (page, y)) in enumerate(zip(file_names, _index_layout(len(file_names))), 1):
+        if page != current_page:
             c.showPage()
-            y = height - inch
-        c.drawString(72, y, f"{i}. {name}")
-        y -= 25
+            c.setFont("Helvetica", 11)
+            current_page = page
+        label = f"{i}. {name}"
+        c.drawString(72, y, label)
+        number = page_numbers[i - 1] if page_numbers else None
+        if number is not None:
+            number_text = str(number)
+            c.drawRightString(width - 72, y, number_text)
+            # Dot leader between the title and the page number
+            dots_start = 72 + c.stringWidth(label, "Helvetica", 11) + 6
+            dots_end = width - 72 - c.stringWidth(number_text, "Helvetica", 11) - 6
+            dot_width = c.stringWidth('.', "Helvetica", 11)
+            if dots_end > dots_start:
+                c.drawString(dots_start, y, '.' * int((dots_end - dots_start) / dot_width))
     c.showPage()
     c.save()
 
@@ -160,7 +422,7 @@ def pptx_to_text(pptx_path):
 
 def txt_to_text(txt_path):
     """Read text file"""
-    with open(txt_path, 'r', encoding='utf-8', errors='ignore') as f:
+    with open(txt_path, 'r', encoding=text_encoding(txt_path), errors='ignore') as f:
         return f.read()
 
 def image_to_pdf(image_path, output_pdf):
@@ -182,7 +444,7 @@ def text_to_pdf(text, output_pdf):
     """Convert plain text to PDF with formatting"""
     doc = SimpleDocTemplate(output_pdf, pagesize=letter)
     story = []
-    styles = getSampleStyleSheet()
+    styles = SAMPLE_STYLES
     
     for line in text.split('\n'):
         if line.strip():
@@ -191,8 +453,15 @@ def text_to_pdf(text, output_pdf):
     
     doc.build(story)
 
-def docx_to_pdf(docx_path, output_pdf):
-    """Convert DOCX to PDF - try LibreOffice first, fallback to manual"""
+_libreoffice_path = None
+_libreoffice_probed = False
+
+def find_libreoffice():
+    """Locate a working LibreOffice binary, probing only once per process (None if unavailable)"""
+    global _libreoffice_path, _libreoffice_probed
+    if _libreoffice_probed:
+        return _libreoffice_path
+
     libreoffice_commands = [
         'libreoffice', 'soffice',
         '/Applications/LibreOffice.app/Contents/MacOS/soffice',
@@ -200,43 +469,58 @@ def docx_to_pdf(docx_path, output_pdf):
         'C:\\Program Files (x86)\\LibreOffice\\program\\soffice.exe'
     ]
 
-    libreoffice_path = None
     for cmd in libreoffice_commands:
         try:
             result = subprocess.run([cmd, '--version'], capture_output=True, timeout=5, text=True)
             if result.returncode == 0:
-                libreoffice_path = cmd
+                _libreoffice_path = cmd
                 print(f"✅ Found LibreOffice: {cmd}")
                 break
         except Exception:
             continue
 
-    # Try LibreOffice if available
-    if libreoffice_path:
-        try:
-            output_dir = os.path.dirname(output_pdf)
-            subprocess.run([
-                libreoffice_path, '--headless', '--nologo',
-                '--nofirststartwizard', '--norestore',
-                '--convert-to', 'pdf', '--outdir', output_dir, docx_path
-            ], capture_output=True, timeout=60)
-
-            base_name = os.path.splitext(os.path.basename(docx_path))[0]
-            temp_pdf = os.path.join(output_dir, f"{base_name}.pdf")
-
-            if os.path.exists(temp_pdf):
-                os.rename(temp_pdf, output_pdf)
-                print(f"✅ LibreOffice conversion SUCCESS: {os.path.basename(docx_path)}")
-                return
-        except Exception as e:
-            print(f"⚠️ LibreOffice failed, trying manual conversion: {e}")
+    _libreoffice_probed = True
+    return _libreoffice_path
+
+def libreoffice_to_pdf(src_path, output_pdf, timeout=60):
+    """Convert a document to PDF with headless LibreOffice; returns True on success"""
+    libreoffice_path = find_libreoffice()
+    if not libreoffice_path:
+        return False
+
+    try:
+        output_dir = os.path.dirname(output_pdf)
+        # One profile per process so parallel workers don't block on a shared profile lock
+        profile_dir = Path(TEMP_DIR, f"lo_profile_{os.getpid()}").as_uri()
+        subprocess.run([
+            libreoffice_path, '--headless', '--nologo',
+            '--nofirststartwizard', '--norestore',
+            f'-env:UserInstallation={profile_dir}',
+            '--convert-to', 'pdf', '--outdir', output_dir, src_path
+        ], capture_output=True, timeout=timeout)
+
+        base_name = os.path.splitext(os.path.basename(src_path))[0]
+        temp_pdf = os.path.join(output_dir, f"{base_name}.pdf")
+
+        if os.path.exists(temp_pdf):
+            os.replace(temp_pdf, output_pdf)
+            print(f"✅ LibreOffice conversion SUCCESS: {os.path.basename(src_path)}")
+            return True
+    except Exception as e:
+        print(f"⚠️ LibreOffice failed: {e}")
+    return False
+
+def docx_to_pdf(docx_path, output_pdf):
+    """Convert DOCX to PDF - try LibreOffice first, fallback to manual"""
+    if libreoffice_to_pdf(docx_path, output_pdf):
+        return
 
     # Manual fallback conversion
     print(f"⚠️ Using manual DOCX conversion for: {os.path.basename(docx_path)}")
     try:
         doc = SimpleDocTemplate(output_pdf, pagesize=letter)
         story = []
-        styles = getSampleStyleSheet()
+        styles = SAMPLE_STYLES
         source_doc = Document(docx_path)
         
         for para in source_doc.paragraphs:
@@ -270,36 +554,403 @@ def docx_to_pdf(docx_path, output_pdf):
         print(f"❌ Manual DOCX conversion failed: {e}")
         raise
 
-def pptx_to_pdf(pptx_path, output_pdf):
-    """Convert PPTX to PDF"""
-    doc = SimpleDocTemplate(output_pdf, pagesize=letter)
-    story = []
-    styles = getSampleStyleSheet()
-    
-    slide_title_style = ParagraphStyle(
-        'SlideTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor='#2c3e50',
-        spaceAfter=12,
-        alignment=1
-    )
-    
+# Built once: getSampleStyleSheet() constructs every style object on each call
+SAMPLE_STYLES = getSampleStyleSheet()
+
+# Write binary (zlib) streams; ASCII85-encoding images and pages is slow and inflates them ~25%
+rl_config.useA85 = 0
+
+# Slide text styles for the canvas PPTX renderer
+EMU_PER_POINT = 12700
+PPTX_TEXT_STYLES = {
+    'title': {'font': 'Helvetica-Bold', 'size': 28, 'color': colors.HexColor('#2c3e50')},
+    'body': {'font': 'Helvetica', 'size': 18, 'color': colors.black},
+    'table': {'font': 'Helvetica', 'size': 10, 'color': colors.black},
+    'footer': {'font': 'Helvetica', 'size': 8, 'color': colors.grey},
+}
+PPTX_TEXT_INSET = 7.2       # points, PowerPoint's default text frame inset
+PPTX_LEVEL_INDENT = 18      # points per bullet level
+PPTX_LINE_SPACING = 1.2
+PPTX_SHAPE_TAG = pptx_qn('p:sp')
+PPTX_PICTURE_TAG = pptx_qn('p:pic')
+PPTX_GROUP_TAG = pptx_qn('p:grpSp')
+PPTX_GRAPHIC_FRAME_TAG = pptx_qn('p:graphicFrame')
+PPTX_NVPR_TAG = pptx_qn('p:nvPr')
+PPTX_PH_TAG = pptx_qn('p:ph')
+
+def _wrap_line(text, font, size, max_width):
+    """Greedy word wrap of one line using font metrics, measuring each word once"""
+    if stringWidth(text, font, size) <= max_width:
+        return [text]
+    space = stringWidth(' ', font, size)
+    lines = []
+    line = []
+    line_width = 0
+    for word in text.split(' '):
+        word_width = stringWidth(word, font, size)
+        if line and line_width + space + word_width > max_width:
+            lines.append(' '.join(line))
+            line = [word]
+            line_width = word_width
+        else:
+            line_width += word_width + (space if line else 0)
+            line.append(word)
+    lines.append(' '.join(line))
+    return lines
+
+def _paragraph_format(p, default_size):
+    """(size, bold, level) of an a:p element, read from its XML.
+
+    python-pptx's font and level properties call get_or_add_rPr/pPr, adding
+    nodes to the deck on every read, so the attributes are read directly.
+    """
+    size = None
+    bold = False
+    for r in p.r_lst:
+        rPr = r.rPr
+        if rPr is None:
+            continue
+        sz = rPr.get('sz')
+        if size is None and sz:
+            size = int(sz) / 100
+        bold = bold or rPr.get('b') in ('1', 'true')
+    pPr = p.pPr
+    level = int(pPr.get('lvl', 0)) if pPr is not None else 0
+    return size or default_size, bold, level
+
+def _draw_text_frame(c, txBody, x, top, width, style, bullets=False):
+    """Draw an a:txBody's paragraphs top-down from `top`, wrapping to `width`.
+
+    The whole frame goes into one PDF text object: each paragraph sets its
+    origin once and advances line by line with the font's leading.
+    """
+    t = c.beginText()
+    t.setFillColor(style['color'])
+    current_font = None
+    y = top - PPTX_TEXT_INSET
+    for p in txBody.p_lst:
+        text = ''.join(elm.text for elm in p.content_children).replace('\v', '\n')
+        size, bold, level = _paragraph_format(p, style['size'])
+        leading = size * PPTX_LINE_SPACING
+        if not text.strip():
+            y -= leading
+            continue
+
+        font = 'Helvetica-Bold' if bold or style['font'].endswith('Bold') else 'Helvetica'
+        indent = PPTX_TEXT_INSET + level * PPTX_LEVEL_INDENT
+        if bullets:
+            text = '\u2022 ' + text
+
+        if (font, size) != current_font:
+            t.setFont(font, size, leading)
+            current_font = (font, size)
+        lines = [line for raw_line in text.split('\n')
+                 for line in _wrap_line(raw_line, font, size, width - indent - PPTX_TEXT_INSET)]
+        # Lines whose baseline would fall below the page are dropped
+        fits = max(0, int((y - size) // leading) + 1)
+        if fits:
+            t.setTextOrigin(x + indent, y - size)
+            for line in lines[:fits]:
+                t.textLine(line)
+        if fits < len(lines):
+            break
+        y -= leading * len(lines)
+    c.drawText(t)
+
+def _pptx_image_form(c, image_part, cache):
+    """Name of a unit-size XObject holding a picture, or None if it can't be decoded.
+
+    Each distinct picture is registered once and placed with doForm. JPEGs
+    become image XObjects straight from their bytes (DCTDecode); drawImage
+    would decode and hash the pixels first just to name the image. Other
+    formats are drawn once into a form via drawImage.
+    """
+    if image_part.partname in cache:
+        return cache[image_part.partname]
+    key = image_part.sha1
+    if key not in cache:
+        name = f"pptx_img_{key}"
+        cache[key] = None
+        if image_part.ext in ('jpg', 'jpeg'):
+            xobject = pdfdoc.PDFImageXObject(name)
+            if xobject.loadImageFromJPEG(io.BytesIO(image_part.blob)):
+                c._doc.addForm(name, xobject)
+                cache[key] = name
+
+        if cache[key] is None:
+            if image_part.ext in ('jpg', 'jpeg', 'png', 'gif', 'bmp'):
+                reader = ImageReader(io.BytesIO(image_part.blob))
+            else:
+                # WMF/EMF/TIFF etc.: let Pillow decode what it can
+                try:
+                    reader = ImageReader(Image.open(io.BytesIO(image_part.blob)).convert('RGB'))
+                except Exception:
+                    reader = None
+            if reader is not None:
+                c.beginForm(name, 0, 0, 1, 1)
+                c.drawImage(reader, 0, 0, width=1, height=1, mask='auto')
+                c.endForm()
+                cache[key] = name
+    cache[image_part.partname] = cache[key]
+    return cache[key]
+
+def _pptx_shape_box(element, ph, slide, layout_cache, page_width, page_height, transform=None):
+    """(x, top, width, height) of a shape element in points.
+
+    Placeholders without their own position inherit it from the slide layout,
+    resolved once per layout placeholder and cached. Shapes inside groups are
+    mapped to slide coordinates with the group's child-to-parent transform.
+    """
+    if ph is not None and element.xfrm is None:
+        layout = slide.slide_layout
+        key = (layout.part.partname, ph.get('idx', '0'))
+        if key not in layout_cache:
+            base = layout.placeholders.get(idx=int(key[1]))
+            extents = (base.left, base.top, base.width, base.height) if base is not None else (None,)
+            layout_cache[key] = _pptx_box_from_emu(extents, page_width, page_height)
+        return layout_cache[key]
+    return _pptx_box_from_emu((element.x, element.y, element.cx, element.cy), page_width, page_height, transform)
+
+def _pptx_box_from_emu(extents, page_width, page_height, transform=None):
+    if None in extents:
+        return (36, page_height - 36, page_width - 72, page_height - 72)
+    left, top, width, height = extents
+    if transform is not None:
+        off_x, off_y, scale_x, scale_y = transform
+        left, top = off_x + left * scale_x, off_y + top * scale_y
+        width, height = width * scale_x, height * scale_y
+    return (left / EMU_PER_POINT, page_height - top / EMU_PER_POINT,
+            width / EMU_PER_POINT, height / EMU_PER_POINT)
+
+def _pptx_group_transform(group, transform=None):
+    """Compose a group's child-to-parent mapping (a:off/a:ext over a:chOff/a:chExt) with the enclosing one.
+
+    A transform is (offset x, offset y, scale x, scale y) in EMU, taking child
+    coordinates to slide coordinates; None is the identity.
+    """
+    off_x, off_y, scale_x, scale_y = transform or (0, 0, 1, 1)
+    xfrm = group.xfrm
+    if xfrm is None or None in (xfrm.off, xfrm.ext, xfrm.chOff, xfrm.chExt):
+        return transform
+    group_scale_x = xfrm.ext.cx / xfrm.chExt.cx if xfrm.chExt.cx else 1
+    group_scale_y = xfrm.ext.cy / xfrm.chExt.cy if xfrm.chExt.cy else 1
+    return (off_x + scale_x * (xfrm.off.x - xfrm.chOff.x * group_scale_x),
+            off_y + scale_y * (xfrm.off.y - xfrm.chOff.y * group_scale_y),
+            scale_x * group_scale_x, scale_y * group_scale_y)
+
+def _draw_pptx_shapes(c, container, slide, page_width, page_height, image_cache, layout_cache, transform=None):
+    """Draw the shapes of a slide's spTree (or a group) straight from the XML.
+
+    python-pptx's shape objects re-run an XPath query for p:ph on nearly every
+    property access, so only tables are wrapped in one. 'transform' maps a
+    group's child coordinates to the slide (see _pptx_group_transform).
+    """
+    for element in container.iter_shape_elms():
+        try:
+            tag = element.tag
+            if tag == PPTX_GROUP_TAG:
+                _draw_pptx_shapes(c, element, slide, page_width, page_height, image_cache, layout_cache,
+                                  _pptx_group_transform(element, transform))
+                continue
+
+            nvPr = element[0].find(PPTX_NVPR_TAG)
+            ph = nvPr.find(PPTX_PH_TAG) if nvPr is not None else None
+            x, top, width, height = _pptx_shape_box(element, ph, slide, layout_cache, page_width, page_height,
+                                                    transform)
+
+            if tag == PPTX_PICTURE_TAG:
+                if element.blip_rId is None:
+                    continue
+                form = _pptx_image_form(c, slide.part.related_part(element.blip_rId), image_cache)
+                if form is not None:
+                    c.saveState()
+                    c.translate(x, top - height)
+                    c.scale(width, height)
+                    c.doForm(form)
+                    c.restoreState()
+                continue
+
+            if tag == PPTX_GRAPHIC_FRAME_TAG:
+                frame = GraphicFrame(element, None)
+                if not frame.has_table:
+                    continue
+                table = frame.table
+                style = PPTX_TEXT_STYLES['table']
+                c.setStrokeColor(colors.grey)
+                scale_x, scale_y = transform[2:] if transform else (1, 1)
+                row_top = top
+                for row in table.rows:
+                    row_height = row.height * scale_y / EMU_PER_POINT
+                    cell_x = x
+                    for column, cell in zip(table.columns, row.cells):
+                        col_width = column.width * scale_x / EMU_PER_POINT
+                        c.rect(cell_x, row_top - row_height, col_width, row_height)
+                        if cell._tc.txBody is not None:
+                            _draw_text_frame(c, cell._tc.txBody, cell_x, row_top, col_width, style)
+                        cell_x += col_width
+                    row_top -= row_height
+                continue
+
+            txBody = element.txBody if tag == PPTX_SHAPE_TAG else None
+            if txBody is not None:
+                ph_type = ph.get('type', 'obj') if ph is not None else None
+                style = PPTX_TEXT_STYLES['title' if ph_type in ('title', 'ctrTitle') else 'body']
+                _draw_text_frame(c, txBody, x, top, width, style, bullets=ph_type in ('body', 'obj'))
+        except Exception as e:
+            print(f"⚠️ Skipped a slide shape ({element.shape_name}): {e}")
+
+def pptx_to_pdf(pptx_path, output_pdf, renderer=None):
+    """Convert PPTX to PDF.
+
+    The default 'fast' renderer lays each slide out directly on a reportlab
+    canvas at the deck's own page size: text frames at their positions, tables
+    as grids and pictures embedded (JPEGs without re-encoding). 'libreoffice'
+    routes through LibreOffice for full fidelity, falling back to the fast
+    renderer if LibreOffice is unavailable or fails.
+    """
+    renderer = renderer or PPTX_RENDERER
+    if renderer == 'libreoffice' and libreoffice_to_pdf(pptx_path, output_pdf):
+        return
+
     prs = Presentation(pptx_path)
-    
+    page_width = prs.slide_width / EMU_PER_POINT
+    page_height = prs.slide_height / EMU_PER_POINT
+
+    c = canvas.Canvas(output_pdf, pagesize=(page_width, page_height), pageCompression=1)
+    image_cache = {}
+    layout_cache = {}
+    footer = PPTX_TEXT_STYLES['footer']
+
     for slide_num, slide in enumerate(prs.slides, 1):
-        story.append(Paragraph(f"Slide {slide_num}", slide_title_style))
-        story.append(Spacer(1, 0.2 * inch))
-        
-        for shape in slide.shapes:
-            if hasattr(shape, "text") and shape.text.strip():
-                story.append(Paragraph(shape.text, styles['Normal']))
-                story.append(Spacer(1, 0.1 * inch))
-        
-        if slide_num < len(prs.slides):
-            story.append(PageBreak())
-    
-    doc.build(story)
+        _draw_pptx_shapes(c, slide.shapes._spTree, slide, page_width, page_height, image_cache, layout_cache)
+        c.setFont(footer['font'], footer['size'])
+        c.setFillColor(footer['color'])
+        c.drawRightString(page_width - 18, 12, f"Slide {slide_num}")
+        c.showPage()
+
+    c.save()
+
+# PDF TEXT EXTRACTION
+_text_cache = OrderedDict()
+_text_cache_lock = threading.Lock()
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+def file_sha256(path):
+    """Return the SHA-256 hex digest of a file"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def _cache_get_page_text(file_hash, page_num, budget):
+    with _text_cache_lock:
+        for key in ((file_hash, page_num, budget), (file_hash, page_num, None)):
+            if key in _text_cache:
+                _text_cache.move_to_end(key)
+                text = _text_cache[key]
+                return text if budget is None else text[:budget]
+    return None
+
+def _cache_put_page_text(file_hash, page_num, budget, text):
+    with _text_cache_lock:
+        _text_cache[(file_hash, page_num, budget)] = text
+        _text_cache.move_to_end((file_hash, page_num, budget))
+        while len(_text_cache) > TEXT_CACHE_MAX_PAGES:
+            _text_cache.popitem(last=False)
+
+def extract_page_text(page, budget=None):
+    """Extract text from one PDF page, keeping at most `budget` characters.
+
+    PyPDF2 parses the whole content stream before it emits any text, so the
+    budget limits what is returned and cached, not the parsing work.
+    """
+    text = page.extract_text() or ''
+    return text if budget is None else text[:budget]
+
+def _extract_pages_worker(pdf_path, start, stop, budget):
+    """Process pool task: extract text for pages [start, stop) of a PDF"""
+    reader = PdfReader(pdf_path)
+    return [extract_page_text(reader.pages[i], budget) for i in range(start, stop)]
+
+def _get_extract_pool():
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(max_workers=TEXT_EXTRACT_WORKERS)
+        return _extract_pool
+
+def _discard_broken_extract_pool():
+    """Drop the text extraction pool if a worker died, so the next request gets a fresh one"""
+    global _extract_pool
+    with _extract_pool_lock:
+        pool = _extract_pool
+        if pool is None or not getattr(pool, '_broken', False):
+            return
+        _extract_pool = None
+    pool.shutdown(wait=False)
+    print("⚠️ Text extraction pool worker died, starting a new pool")
+
+def _submit_extract_task(fn, *args):
+    """Submit fn(*args) to the text extraction pool, replacing the pool once if it is broken"""
+    try:
+        return _get_extract_pool().submit(fn, *args)
+    except BrokenProcessPool:
+        _discard_broken_extract_pool()
+    return _get_extract_pool().submit(fn, *args)
+
+def iter_pdf_page_texts(pdf_path, budget=None, file_hash=None):
+    """Yield (page_index, text) for every page of a PDF, in page order.
+
+    Pages are served from the cache when possible; the rest are extracted in
+    chunks on a process pool (large PDFs) or in-process (small PDFs), and each
+    page is yielded as soon as its chunk is done. Pass file_hash (the file's
+    SHA-256) when it is already known to skip rehashing the file.
+    """
+    file_hash = file_hash or file_sha256(pdf_path)
+    reader = PdfReader(pdf_path)
+    num_pages = len(reader.pages)
+
+    chunks = []
+    for start in range(0, num_pages, TEXT_EXTRACT_CHUNK_PAGES):
+        stop = min(start + TEXT_EXTRACT_CHUNK_PAGES, num_pages)
+        cached = [_cache_get_page_text(file_hash, i, budget) for i in range(start, stop)]
+        chunks.append((start, stop, cached))
+
+    use_pool = num_pages >= TEXT_EXTRACT_PARALLEL_MIN_PAGES and TEXT_EXTRACT_WORKERS > 1
+    futures = {}
+    if use_pool:
+        try:
+            for start, stop, cached in chunks:
+                if any(text is None for text in cached):
+                    futures[start] = _submit_extract_task(_extract_pages_worker, pdf_path, start, stop, budget)
+        except Exception as e:
+            print(f"⚠️ Text extraction pool unavailable, extracting serially: {e}")
+            futures = {}
+
+    for start, stop, cached in chunks:
+        if all(text is not None for text in cached):
+            texts = cached
+        else:
+            texts = None
+            if start in futures:
+                try:
+                    texts = futures[start].result()
+                except BrokenProcessPool as e:
+                    _discard_broken_extract_pool()
+                    print(f"⚠️ Text extraction worker died for pages {start + 1}-{stop}, extracting in-process: {e}")
+                except Exception as e:
+                    print(f"⚠️ Parallel text extraction failed for pages {start + 1}-{stop}: {e}")
+            if texts is None:
+                texts = [cached[i - start] if cached[i - start] is not None
+                         else extract_page_text(reader.pages[i], budget)
+                         for i in range(start, stop)]
+            for i, text in enumerate(texts, start):
+                _cache_put_page_text(file_hash, i, budget, text)
+
+        for i, text in enumerate(texts, start):
+            yield i, text
 
 # COMBINERS FOR DIFFERENT OUTPUT FORMATS
 def combine_to_pdf(files, output_path):
@@ -372,10 +1023,8 @@ def combine_to_docx(files, output_path):
         
         try:
             if file_type == 'pdf':
-                reader = PdfReader(file_path)
-                for page_num, page in enumerate(reader.pages):
+                for page_num, text in iter_pdf_page_texts(file_path, file_hash=file_info.get('hash')):
                     doc.add_heading(f'Page {page_num + 1}', level=2)
-                    text = page.extract_text()
                     if text.strip():
                         for para in text.split('\n'):
                             if para.strip():
@@ -450,8 +1099,8 @@ def combine_to_pptx(files, output_path):
         
         try:
             if file_type == 'pdf':
-                reader = PdfReader(file_path)
-                for page_num, page in enumerate(reader.pages):
+                for page_num, text in iter_pdf_page_texts(file_path, budget=PPTX_PAGE_TEXT_BUDGET,
+                                                          file_hash=file_info.get('hash')):
                     slide = prs.slides.add_slide(prs.slide_layouts[5])
                     
                     left = top = PptxInches(0.5)
@@ -463,9 +1112,8 @@ def combine_to_pptx(files, output_path):
                     tf.word_wrap = True
                     tf.text = f"Page {page_num + 1}\n\n"
                     
-                    text = page.extract_text()
                     if text.strip():
-                        tf.text += text[:2000]
+                        tf.text += text
             
             elif file_type == 'docx':
                 content = docx_to_text_with_formatting(file_path)
@@ -549,6 +1197,610 @@ def combine_to_pptx(files, output_path):
     
     prs.save(output_path)
 
+# PREVIEW THUMBNAILS
+_preview_cache = OrderedDict()
+_preview_cache_bytes = 0
+_preview_cache_lock = threading.Lock()
+
+def _preview_cache_get(key):
+    with _preview_cache_lock:
+        if key in _preview_cache:
+            _preview_cache.move_to_end(key)
+            return _preview_cache[key]
+    return None
+
+def _preview_cache_put(key, png_bytes):
+    global _preview_cache_bytes
+    with _preview_cache_lock:
+        if key in _preview_cache:
+            return
+        _preview_cache[key] = png_bytes
+        _preview_cache_bytes += len(png_bytes)
+        while _preview_cache_bytes > PREVIEW_CACHE_MAX_BYTES and _preview_cache:
+            _, evicted = _preview_cache.popitem(last=False)
+            _preview_cache_bytes -= len(evicted)
+
+def _thumbnail_png(img, size):
+    """Shrink a PIL image to fit size x size and return PNG bytes"""
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    img.thumbnail((size, size))
+    out = io.BytesIO()
+    img.save(out, 'PNG', optimize=True)
+    return out.getvalue()
+
+def _text_card_png(lines, size):
+    """Render the first few lines of text onto a blank page-shaped thumbnail"""
+    from PIL import ImageDraw
+    width, height = int(size * 8.5 / 11), size
+    img = Image.new('RGB', (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, 0, width - 1, height - 1], outline=(200, 200, 200))
+    y = 6
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if y > height - 14:
+            break
+        draw.text((6, y), line[:width // 6], fill=(60, 60, 60))
+        y += 12
+    return _thumbnail_png(img, size)
+
+def _ooxml_embedded_thumbnail(path):
+    """Return the thumbnail image PowerPoint/Word embed in docProps/, if any"""
+    try:
+        with zipfile.ZipFile(path) as zf:
+            for name in zf.namelist():
+                if name.lower().startswith('docprops/thumbnail.') and name.lower().rsplit('.', 1)[1] in ('jpeg', 'jpg', 'png'):
+                    return Image.open(io.BytesIO(zf.read(name)))
+    except Exception:
+        pass
+    return None
+
+def _pdf_first_page_png(path, size):
+    """Render only the first PDF page with pdftoppm, scaled straight to thumbnail size"""
+    pdftoppm = shutil.which('pdftoppm')
+    if not pdftoppm:
+        return None
+    try:
+        result = subprocess.run(
+            [pdftoppm, '-f', '1', '-l', '1', '-scale-to', str(size), '-png', path],
+            capture_output=True, timeout=20
+        )
+        if result.returncode == 0 and result.stdout:
+            return _thumbnail_png(Image.open(io.BytesIO(result.stdout)), size)
+    except Exception as e:
+        print(f"⚠️ pdftoppm preview failed: {e}")
+    return None
+
+def render_preview(path, file_type, size):
+    """Return PNG bytes for a small first-page thumbnail, using the cheapest path per type"""
+    if file_type == 'image':
+        img = Image.open(path)
+        # JPEG can decode straight at 1/2, 1/4 or 1/8 scale
+        img.draft('RGB', (size, size))
+        return _thumbnail_png(img, size)
+
+    if file_type == 'pdf':
+        png = _pdf_first_page_png(path, size)
+        if png:
+            return png
+        reader = PdfReader(path)
+        text = extract_page_text(reader.pages[0], budget=1000) if reader.pages else ''
+        return _text_card_png(text.split('\n'), size)
+
+    if file_type in ('docx', 'pptx'):
+        img = _ooxml_embedded_thumbnail(path)
+        if img is not None:
+            return _thumbnail_png(img, size)
+        try:
+            if file_type == 'docx':
+                lines = [p.text for p in Document(path).paragraphs[:40]]
+            else:
+                prs = Presentation(path)
+                first_slide = next(iter(prs.slides), None)
+                lines = [shape.text for shape in first_slide.shapes if hasattr(shape, 'text')] if first_slide else []
+        except Exception as e:
+            # Legacy OLE2 .doc/.ppt (and damaged OOXML) can't be opened here
+            print(f"⚠️ No text preview for {os.path.basename(path)}: {e}")
+            return None
+        return _text_card_png(lines, size)
+
+    if file_type == 'txt':
+        with open(path, 'r', encoding=text_encoding(path), errors='ignore') as f:
+            return _text_card_png(f.read(4000).split('\n'), size)
+
+    return None
+
+# UNIDOC ASSEMBLY
+def write_message_pdf(output_pdf, lines):
+    """Write a one-page PDF containing the given lines of text (error/placeholder pages)"""
+    c = canvas.Canvas(output_pdf, pagesize=letter)
+    c.setFont("Helvetica", 12)
+    y = 750
+    for line in lines:
+        c.drawString(60, y, line)
+        y -= 20
+    c.save()
+
+def convert_to_pdf(file_path, file_type, output_pdf, filename=None):
+    """Convert a non-PDF input file to PDF at output_pdf"""
+    filename = filename or os.path.basename(file_path)
+    if file_type == 'image':
+        image_to_pdf(file_path, output_pdf)
+    elif file_type == 'txt':
+        text_to_pdf(txt_to_text(file_path), output_pdf)
+    elif file_type == 'docx':
+        docx_to_pdf(file_path, output_pdf)
+    elif file_type == 'pptx':
+        pptx_to_pdf(file_path, output_pdf)
+    else:
+        # Unknown type - create placeholder
+        write_message_pdf(output_pdf, [f"File: {filename}", "Unsupported file type"])
+
+def pdf_for_input(file_path, file_type, filename, temp_files):
+    """Return (pdf_path, ok) for an input file, converting (or writing an error page) as needed.
+
+    ok is False when pdf_path is an error page. Any PDF created here is appended
+    to temp_files for the caller to clean up.
+    """
+    if file_type == 'pdf':
+        return file_path, True
+
+    converted_pdf = os.path.join(TEMP_DIR, f"converted_{time.time_ns()}.pdf")
+    try:
+        convert_to_pdf(file_path, file_type, converted_pdf, filename)
+        temp_files.append(converted_pdf)
+        return converted_pdf, True
+    except Exception as e:
+        # Create error page for this file
+        error_pdf = os.path.join(TEMP_DIR, f"error_{time.time_ns()}.pdf")
+        write_message_pdf(error_pdf, [f"Error processing file: {filename}", f"Error: {str(e)}"])
+        temp_files.append(converted_pdf)
+        temp_files.append(error_pdf)
+        print(f"Error processing {filename}: {e}")
+        return error_pdf, False
+
+def convert_to_pdf_isolated(file_path, file_type, output_pdf):
+    """Convert one input to output_pdf inside a private scratch directory; returns elapsed seconds.
+
+    LibreOffice names its output after the input file, so parallel workers
+    converting two different "syllabus.docx" files must not share a directory.
+    """
+    start = time.time()
+    work_dir = tempfile.mkdtemp(prefix='unidoc_conv_', dir=TEMP_DIR)
+    try:
+        tmp_pdf = os.path.join(work_dir, 'converted.pdf')
+        convert_to_pdf(file_path, file_type, tmp_pdf, os.path.basename(file_path))
+        shutil.move(tmp_pdf, output_pdf)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return time.time() - start
+
+def pdf_outline_tree(reader):
+    """A PDF's own bookmarks as nested [{'title', 'page', 'children'}] with 0-based pages.
+
+    Bookmarks that don't point at a page of this PDF are dropped with their children.
+    """
+    def walk(nodes):
+        tree = []
+        last = None
+        for node in nodes:
+            if isinstance(node, list):
+                # A nested list holds the children of the bookmark before it
+                if last is not None:
+                    last['children'] = walk(node)
+                continue
+            try:
+                page = reader.get_destination_page_number(node)
+            except Exception:
+                page = None
+            if page is None or page < 0:
+                last = None
+                continue
+            last = {'title': str(node.title), 'page': page, 'children': []}
+            tree.append(last)
+        return tree
+
+    try:
+        return walk(reader.outline)
+    except Exception as e:
+        print(f"⚠️ Could not read PDF outline: {e}")
+        return []
+
+def _offset_outline(entries, offset):
+    return [{'title': e['title'], 'page': e['page'] + offset, 'children': _offset_outline(e['children'], offset)}
+            for e in entries]
+
+def write_outline(writer, entries, parent=None):
+    """Add nested [{'title', 'page', 'children'}] bookmarks to a PdfWriter"""
+    for entry in entries:
+        outline_item = writer.add_outline_item(entry['title'], entry['page'], parent=parent)
+        write_outline(writer, entry['children'], outline_item)
+
+def assemble_unidoc(course_data, items, output_path, previous=None):
+    """Write a UniDoc: cover, course info and index pages followed by each item's PDF.
+
+    items is an ordered list of {'name': index title, 'pdf': path or None,
+    'hash': input content hash or None}; items without a PDF are listed in the
+    index but contribute no pages. An input PDF that can't be read is replaced
+    by an error page, as conversion failures are.
+
+    previous ({'pdf': path, 'manifest': dict}) enables an incremental build:
+    sections whose input hash appears in the previous manifest, and the course
+    info/index pages when their content is unchanged, are copied from the
+    previous output instead of being regenerated.
+
+    Each input's own bookmarks are nested under its section bookmark; they are
+    recorded per section in the manifest, so a reused section keeps them.
+
+    Returns the build manifest (input hashes, page spans and outline) for the new output.
+    """
+    writer = PdfWriter()
+    front_pages = []
+    error_pages = []
+    stamp = time.time_ns()
+
+    prev_reader = None
+    prev_manifest = {}
+    reusable = {}  # input hash -> previous manifest section (page span and outline)
+    if previous and previous['manifest'].get('version') == UNIDOC_MANIFEST_VERSION:
+        prev_manifest = previous['manifest']
+        prev_reader = PdfReader(previous['pdf'])
+        for sec in prev_manifest['sections']:
+            if sec.get('hash') and sec['end'] > sec['start']:
+                reusable.setdefault(sec['hash'], sec)
+
+    titles = [item['name'] for item in items]
+    manifest = {
+        'version': UNIDOC_MANIFEST_VERSION,
+        'course': course_data,
+        'front': {},
+        'sections': [],
+        'outline': [],
+    }
+    reused = 0
+
+    try:
+        # Layout pass: page count of every section, from readers opened once and
+        # reused for the merge below (reused sections take their span from the manifest)
+        sections = []
+        outlines = []  # per section, its input's own bookmarks relative to the section start
+        items = list(items)
+        for idx, item in enumerate(items):
+            item_hash = item.get('hash')
+            if prev_reader is not None and item_hash in reusable:
+                sec = reusable[item_hash]
+                sections.append((prev_reader, (sec['start'], sec['end']), sec['end'] - sec['start']))
+                outlines.append(sec['outline'])
+            elif item['pdf']:
+                try:
+                    reader = PdfReader(item['pdf'])
+                    count = len(reader.pages)
+                except Exception as e:
+                    # Unreadable PDF: an error page takes its place, with no hash so it is never reused
+                    error_pdf = os.path.join(TEMP_DIR, f"error_{time.time_ns()}.pdf")
+                    write_message_pdf(error_pdf, [f"Error processing file: {item.get('file') or item['name']}",
+                                                  f"Error: {str(e)}"])
+                    error_pages.append(error_pdf)
+                    print(f"Error reading {item['pdf']}: {e}")
+                    items[idx] = dict(item, pdf=error_pdf, hash=None)
+                    reader = PdfReader(error_pdf)
+                    count = len(reader.pages)
+                sections.append((reader, None, count))
+                outlines.append(pdf_outline_tree(reader))
+            else:
+                sections.append((None, None, 0))
+                outlines.append([])
+
+        # Generate (or reuse) the 3 front pages
+        cover_fp = os.path.join(TEMP_DIR, f"cover_{stamp}.pdf")
+        info_fp = os.path.join(TEMP_DIR, f"course_info_{stamp}.pdf")
+        index_fp = os.path.join(TEMP_DIR, f"index_{stamp}.pdf")
+        front_pages = [cover_fp, info_fp, index_fp]
+        prev_front = prev_manifest.get('front', {})
+
+        def add_front(key, fp, create, unchanged):
+            start = len(writer.pages)
+            if prev_reader is not None and unchanged and key in prev_front:
+                # Links on a reused index are re-added below, so drop the old ones
+                writer.append(prev_reader, pages=tuple(prev_front[key]), import_outline=False,
+                              excluded_fields=['/Annots'])
+            else:
+                create()
+                writer.append(fp)
+            manifest['front'][key] = [start, len(writer.pages)]
+
+        # The cover carries the generation date, so it is always redrawn
+        add_front('cover', cover_fp, lambda: create_cover_page(cover_fp), False)
+        add_front('info', info_fp, lambda: create_course_info_page(course_data, info_fp),
+                  prev_manifest.get('course') == course_data)
+
+        # Section start pages follow from the index length, known before it is drawn
+        index_start = len(writer.pages)
+        page = index_start + index_page_count(len(titles))
+        starts = []
+        for _, _, count in sections:
+            starts.append(page)
+            page += count
+        page_numbers = [start + 1 if count else None for start, (_, _, count) in zip(starts, sections)]
+
+        add_front('index', index_fp, lambda: create_index_page(titles, index_fp, page_numbers),
+                  prev_manifest.get('index_titles') == titles
+                  and prev_manifest.get('index_page_numbers') == page_numbers)
+        manifest['index_titles'] = titles
+        manifest['index_page_numbers'] = page_numbers
+
+        for item, (reader, span, count), outline in zip(items, sections, outlines):
+            start = len(writer.pages)
+            if span is not None:
+                writer.append(reader, pages=span, import_outline=False)
+                reused += 1
+            elif reader is not None:
+                writer.append(reader, import_outline=False)
+            end = len(writer.pages)
+            manifest['sections'].append({'name': item['name'], 'hash': item.get('hash'),
+                                         'start': start, 'end': end, 'outline': outline})
+            if end > start:
+                manifest['outline'].append({'title': item['name'], 'page': start,
+                                            'children': _offset_outline(outline, start)})
+
+        # Internal links from index entries and one bookmark per section
+        for (page_offset, rect), start, number in zip(index_link_rects(len(titles)), starts, page_numbers):
+            if number is not None:
+                index_page = index_start + page_offset
+                writer.add_annotation(index_page, AnnotationBuilder.link(rect=rect, target_page_index=start))
+                # PyPDF2 stores a bare page index; in-document links need the page object itself
+                link = writer.pages[index_page].annotations[-1].get_object()
+                link[NameObject('/Dest')] = ArrayObject([writer.pages[start].indirect_reference, NameObject('/Fit')])
+        write_outline(writer, manifest['outline'])
+
+        with open(output_path, 'wb') as f:
+            writer.write(f)
+        writer.close()
+
+        if prev_reader is not None:
+            print(f"♻️ Incremental UniDoc build: reused {reused}/{len(items)} sections")
+        return manifest
+
+    finally:
+        for p in front_pages + error_pages:
+            try:
+                if os.path.exists(p):
+                    os.remove(p)
+            except Exception:
+                pass
+
+def load_unidoc_build(build_id):
+    """Return {'pdf', 'manifest'} for a stored /combine-unidoc build, or None if unknown/expired"""
+    if not build_id or not re.fullmatch(r'[0-9a-f]{32}', build_id):
+        return None
+    build_dir = os.path.join(TEMP_DIR, f"unidoc_build_{build_id}")
+    pdf_path = os.path.join(build_dir, 'unidoc.pdf')
+    try:
+        with open(os.path.join(build_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.isfile(pdf_path):
+        return None
+    return {'pdf': pdf_path, 'manifest': manifest}
+
+def reusable_section_hashes(previous):
+    """Input hashes whose pages can be copied from a previous build without reconverting"""
+    if not previous or previous['manifest'].get('version') != UNIDOC_MANIFEST_VERSION:
+        return set()
+    return {sec['hash'] for sec in previous['manifest']['sections']
+            if sec.get('hash') and sec['end'] > sec['start']}
+
+_build_pool = None
+_build_pool_lock = threading.Lock()
+
+def _get_build_pool():
+    global _build_pool
+    with _build_pool_lock:
+        if _build_pool is None:
+            _build_pool = ProcessPoolExecutor(max_workers=BUILD_WORKERS)
+        return _build_pool
+
+def _discard_broken_build_pool():
+    """Drop the build pool if a worker died, so the next task gets a fresh one"""
+    global _build_pool
+    with _build_pool_lock:
+        pool = _build_pool
+        if pool is None or not getattr(pool, '_broken', False):
+            return
+        _build_pool = None
+    pool.shutdown(wait=False)
+    print("⚠️ Build pool worker died, starting a new pool")
+
+def submit_build_task(fn, *args):
+    """Submit fn(*args) to the build pool, replacing the pool if it is broken.
+
+    Returns None if even a fresh pool can't take the task; build_task_result
+    then runs it in-process.
+    """
+    try:
+        return _get_build_pool().submit(fn, *args)
+    except BrokenProcessPool:
+        _discard_broken_build_pool()
+    try:
+        return _get_build_pool().submit(fn, *args)
+    except (BrokenProcessPool, OSError) as e:
+        print(f"⚠️ Build pool unavailable, running {fn.__name__} in-process: {e}")
+        return None
+
+def build_task_result(future, fn, *args):
+    """Result of a build pool task; if its worker died, fn(*args) is re-run in-process"""
+    if future is None:
+        return fn(*args)
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        _discard_broken_build_pool()
+        return fn(*args)
+
+def _cleanup_expired_dirs(prefix, ttl, base_dir=TEMP_DIR):
+    """Remove base_dir subdirectories named prefix* that are older than ttl seconds"""
+    cutoff = time.time() - ttl
+    for entry in os.scandir(base_dir):
+        if entry.name.startswith(prefix) and entry.is_dir():
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                pass
+
+# ARTIFACT STORE
+class InlineArtifactStore:
+    """Stream outputs straight back in the response (the original behaviour)"""
+    name = 'inline'
+
+    def deliver(self, path, download_name, mimetype, keep_local=False):
+        return send_file(path, as_attachment=True, download_name=download_name, mimetype=mimetype)
+
+
+class LocalArtifactStore:
+    """Keep outputs under ARTIFACT_DIR and hand out signed, expiring /artifacts/... URLs"""
+    name = 'local'
+    # Only directories with this prefix are ever cleaned up, so ARTIFACT_DIR may be shared (e.g. /tmp)
+    dir_prefix = 'artifact_'
+
+    def __init__(self, root=ARTIFACT_DIR, ttl=ARTIFACT_URL_TTL):
+        self.root = root
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+        self.secret = self._load_secret()
+
+    def _load_secret(self):
+        # Shared by every gunicorn worker: env var first, else a key file created once
+        secret = os.environ.get('ARTIFACT_URL_SECRET')
+        if secret:
+            return secret.encode('utf-8')
+        key_path = os.path.join(self.root, '.url_secret')
+        try:
+            fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+        except FileExistsError:
+            pass
+        with open(key_path, 'r') as f:
+            return f.read().strip().encode('utf-8')
+
+    def sign(self, key, expires):
+        return hmac.new(self.secret, f"{key}:{expires}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def put(self, path, download_name, mimetype, keep_local=False):
+        _cleanup_expired_dirs(self.dir_prefix, self.ttl, self.root)
+        token = secrets.token_hex(16)
+        token_dir = os.path.join(self.root, self.dir_prefix + token)
+        os.makedirs(token_dir)
+        key = f"{token}/{secure_filename(download_name)}"
+        dest = os.path.join(token_dir, secure_filename(download_name))
+        if keep_local:
+            shutil.copyfile(path, dest)
+        else:
+            shutil.move(path, dest)
+
+        expires = int(time.time()) + self.ttl
+        return url_for('download_artifact', token=token, filename=os.path.basename(dest),
+                       expires=expires, sig=self.sign(key, expires), _external=True)
+
+    def open(self, token, filename, expires, sig):
+        """Return the stored file path if the signature is valid and unexpired, else None"""
+        key = f"{token}/{filename}"
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return None
+        if expires < time.time() or not hmac.compare_digest(self.sign(key, expires), sig or ''):
+            return None
+        path = os.path.join(self.root, self.dir_prefix + token, filename)
+        return path if os.path.isfile(path) else None
+
+    def deliver(self, path, download_name, mimetype, keep_local=False):
+        return _artifact_link_response(self.put(path, download_name, mimetype, keep_local), download_name, self.ttl)
+
+
+class S3ArtifactStore:
+    """Upload outputs to S3-compatible storage and return presigned GET URLs.
+
+    Set ARTIFACT_S3_ENDPOINT_URL to target MinIO/localstack; expire old objects
+    with a bucket lifecycle rule on ARTIFACT_S3_PREFIX.
+    """
+    name = 's3'
+
+    def __init__(self, bucket=ARTIFACT_S3_BUCKET, prefix=ARTIFACT_S3_PREFIX,
+                 endpoint_url=ARTIFACT_S3_ENDPOINT_URL, ttl=ARTIFACT_URL_TTL):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        if not bucket:
+            raise ValueError("ARTIFACT_S3_BUCKET must be set when ARTIFACT_STORE=s3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.ttl = ttl
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=ARTIFACT_MULTIPART_CHUNK,
+            multipart_chunksize=ARTIFACT_MULTIPART_CHUNK,
+            max_concurrency=4
+        )
+
+    def put(self, path, download_name, mimetype, keep_local=False):
+        key = f"{self.prefix}{secrets.token_hex(16)}/{secure_filename(download_name)}"
+        # upload_file streams the file from disk, switching to multipart for large outputs
+        self.client.upload_file(path, self.bucket, key, ExtraArgs={'ContentType': mimetype},
+                                Config=self.transfer_config)
+        if not keep_local:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': self.bucket,
+                'Key': key,
+                'ResponseContentDisposition': f'attachment; filename="{secure_filename(download_name)}"',
+            },
+            ExpiresIn=self.ttl
+        )
+
+    def deliver(self, path, download_name, mimetype, keep_local=False):
+        return _artifact_link_response(self.put(path, download_name, mimetype, keep_local), download_name, self.ttl)
+
+
+def _artifact_link_response(url, download_name, ttl):
+    return {'download_url': url, 'filename': download_name, 'expires_in': ttl}
+
+_artifact_store = None
+
+def get_artifact_store():
+    """Return the configured artifact store (created on first use)"""
+    global _artifact_store
+    if _artifact_store is None:
+        stores = {'inline': InlineArtifactStore, 'local': LocalArtifactStore, 's3': S3ArtifactStore}
+        if ARTIFACT_STORE not in stores:
+            raise ValueError(f"Unknown ARTIFACT_STORE: {ARTIFACT_STORE}")
+        _artifact_store = stores[ARTIFACT_STORE]()
+        print(f"✅ Artifact store: {_artifact_store.name}")
+    return _artifact_store
+
+def deliver_output(path, download_name, mimetype, keep_local=False):
+    """Send a finished output to the client via the configured artifact store.
+
+    Inline mode streams the file; the other stores upload it and return JSON
+    with a short-lived download URL. keep_local leaves the local file in place
+    (e.g. when a later incremental build reads it).
+    """
+    return get_artifact_store().deliver(path, download_name, mimetype, keep_local)
+
 # ROUTES
 @app.route('/combine', methods=['POST'])
 def combine_files():
@@ -571,15 +1823,10 @@ def combine_files():
     
     try:
         for file in files:
-            filename = secure_filename(file.filename)
-            temp_path = os.path.join(TEMP_DIR, f"{datetime.now().timestamp()}_{filename}")
-            file.save(temp_path)
-            
-            temp_files.append({
-                'path': temp_path,
-                'name': filename,
-                'type': get_file_type(filename)
-            })
+            upload = ingest_upload(file)
+            temp_files.append(upload)
+            if upload['type'] == 'unknown':
+                return {'error': f'File content does not match a supported type: {file.filename}'}, 400
         
         output_filename = f'combined_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{output_format}'
         output_path = os.path.join(TEMP_DIR, output_filename)
@@ -593,14 +1840,7 @@ def combine_files():
         else:
             return {'error': 'Invalid output format'}, 400
         
-        response = send_file(
-            output_path,
-            as_attachment=True,
-            download_name=output_filename,
-            mimetype=f'application/{output_format}'
-        )
-        
-        return response
+        return deliver_output(output_path, output_filename, f'application/{output_format}')
     
     except Exception as e:
         import traceback
@@ -618,7 +1858,14 @@ def combine_files():
 
 @app.route('/combine-checklist', methods=['POST'])
 def combine_checklist():
-    """Combine files with checklist dividers"""
+    """Combine files with checklist dividers.
+
+    Each unique upload (by content hash) is converted once in the build pool,
+    even if several sections list it. Uploads are already on disk and hashed
+    by the time the request is parsed, so every conversion is submitted up
+    front; section dividers and message pages are drawn while they run, and
+    the PDF is assembled once everything is ready.
+    """
     if 'checklist_data' not in request.form:
         return {'error': 'Missing checklist_data'}, 400
 
@@ -627,95 +1874,121 @@ def combine_checklist():
     except Exception as e:
         return {'error': 'Invalid checklist_data JSON', 'details': str(e)}, 400
 
-    merger = PdfMerger()
     temp_to_cleanup = []
 
     try:
-        for sec_idx, checklist in enumerate(checklist_data):
-            section_name = checklist.get('name') or f"Section {sec_idx+1}"
+        sections = [(checklist.get('name') or f"Section {sec_idx+1}", checklist.get('files', []))
+                    for sec_idx, checklist in enumerate(checklist_data)]
 
-            divider_fp = os.path.join(TEMP_DIR, f"divider_{int(time.time()*1000)}_{sec_idx}.pdf")
-            create_divider_pdf(section_name, divider_fp)
-            temp_to_cleanup.append(divider_fp)
-            merger.append(divider_fp)
-
-            for file_key in checklist.get('files', []):
-                if file_key not in request.files:
+        # 1. Resolve each referenced file key once and start its conversion
+        messages = {}       # file key -> message line (None: skipped silently)
+        uploads = {}        # file key -> ingested upload
+        conversions = {}    # content hash -> (converted path, task, future)
+        for _, file_keys in sections:
+            for file_key in file_keys:
+                if file_key in messages or file_key in uploads:
+                    continue
+                fs = request.files.get(file_key)
+                if fs is None:
                     print(f"Warning: missing file key {file_key}")
-                    warn_fp = os.path.join(TEMP_DIR, f"warn_{int(time.time()*1000)}.pdf")
-                    c = canvas.Canvas(warn_fp, pagesize=letter)
-                    c.setFont("Helvetica", 12)
-                    c.drawString(60, 750, f"Missing file for: {file_key}")
-                    c.save()
-                    temp_to_cleanup.append(warn_fp)
-                    merger.append(warn_fp)
+                    messages[file_key] = f"Missing file for: {file_key}"
                     continue
-
-                fs = request.files[file_key]
                 if fs.filename == '':
+                    messages[file_key] = None
                     continue
 
-                if not allowed_file(fs.filename):
-                    err_fp = os.path.join(TEMP_DIR, f"not_allowed_{int(time.time()*1000)}.pdf")
-                    c = canvas.Canvas(err_fp, pagesize=letter)
-                    c.setFont("Helvetica", 12)
-                    c.drawString(60, 750, f"File type not allowed: {fs.filename}")
-                    c.save()
-                    temp_to_cleanup.append(err_fp)
-                    merger.append(err_fp)
+                upload = ingest_upload(fs) if allowed_file(fs.filename) else None
+                if upload:
+                    temp_to_cleanup.append(upload['path'])
+                if upload is None or upload['type'] == 'unknown':
+                    messages[file_key] = f"File type not allowed: {fs.filename}"
                     continue
 
-                safe_name = secure_filename(fs.filename)
-                saved_raw = os.path.join(TEMP_DIR, f"{int(time.time()*1000)}_{safe_name}")
-                fs.save(saved_raw)
-                temp_to_cleanup.append(saved_raw)
+                uploads[file_key] = upload
+                if upload['type'] != 'pdf' and upload['hash'] not in conversions:
+                    converted_pdf = os.path.join(TEMP_DIR, f"converted_{upload['hash']}_{time.time_ns()}.pdf")
+                    temp_to_cleanup.append(converted_pdf)
+                    task = (convert_to_pdf_isolated, upload['path'], upload['type'], converted_pdf)
+                    conversions[upload['hash']] = (converted_pdf, task, submit_build_task(*task))
 
-                ftype = get_file_type(safe_name)
+        # 2. Dividers and message pages, drawn while the conversions run
+        dividers = []
+        for sec_idx, (section_name, _) in enumerate(sections):
+            divider_fp = os.path.join(TEMP_DIR, f"divider_{time.time_ns()}_{sec_idx}.pdf")
+            temp_to_cleanup.append(divider_fp)
+            create_divider_pdf(section_name, divider_fp)
+            dividers.append(divider_fp)
+
+        message_pdfs = {}
+        for file_key, line in messages.items():
+            if line:
+                warn_fp = os.path.join(TEMP_DIR, f"warn_{time.time_ns()}.pdf")
+                temp_to_cleanup.append(warn_fp)
+                write_message_pdf(warn_fp, [line])
+                message_pdfs[file_key] = warn_fp
+
+        # 3. Wait for the conversions, then assemble in checklist order
+        pdf_by_hash = {}
+        for file_hash, (converted_pdf, task, future) in conversions.items():
+            try:
+                build_task_result(future, *task)
+                pdf_by_hash[file_hash] = converted_pdf
+            except Exception as conv_err:
+                safe_name = next(u['name'] for u in uploads.values() if u['hash'] == file_hash)
+                error_pdf = os.path.join(TEMP_DIR, f"conv_error_{time.time_ns()}.pdf")
+                write_message_pdf(error_pdf, [f"Error converting file: {safe_name}", f"Error: {str(conv_err)}"])
+                temp_to_cleanup.append(error_pdf)
+                pdf_by_hash[file_hash] = error_pdf
+                print(f"Conversion error for {safe_name}:", conv_err)
+
+        # PdfWriter rather than PdfMerger: PdfMerger writes broken outline destinations
+        merger = PdfWriter()
+        readers = {}    # each PDF is parsed once, however many sections list it
+        outlines = {}   # path -> the PDF's own bookmarks
+        def append_pdf(path, name=None):
+            """Append a PDF; returns its first page index in the output and its own bookmarks"""
+            if path not in readers:
                 try:
-                    if ftype == 'pdf':
-                        merger.append(saved_raw)
-                    else:
-                        converted_pdf = os.path.join(TEMP_DIR, f"converted_{int(time.time()*1000)}.pdf")
-                        if ftype == 'image':
-                            image_to_pdf(saved_raw, converted_pdf)
-                        elif ftype == 'txt':
-                            text = txt_to_text(saved_raw)
-                            text_to_pdf(text, converted_pdf)
-                        elif ftype == 'docx':
-                            docx_to_pdf(saved_raw, converted_pdf)
-                        elif ftype == 'pptx':
-                            pptx_to_pdf(saved_raw, converted_pdf)
-                        else:
-                            c = canvas.Canvas(converted_pdf, pagesize=letter)
-                            c.setFont("Helvetica", 12)
-                            c.drawString(60, 750, f"[{safe_name}] - unsupported type, could not convert.")
-                            c.save()
-
-                        temp_to_cleanup.append(converted_pdf)
-                        merger.append(converted_pdf)
-
-                except Exception as conv_err:
-                    error_pdf = os.path.join(TEMP_DIR, f"conv_error_{int(time.time()*1000)}.pdf")
-                    c = canvas.Canvas(error_pdf, pagesize=letter)
-                    c.setFont("Helvetica", 12)
-                    c.drawString(60, 750, f"Error converting file: {safe_name}")
-                    c.drawString(60, 730, f"Error: {str(conv_err)}")
-                    c.save()
+                    readers[path] = PdfReader(path)
+                    len(readers[path].pages)
+                except Exception as read_err:
+                    if name is None:
+                        raise
+                    # Unreadable input: every reference to it gets the same error page
+                    error_pdf = os.path.join(TEMP_DIR, f"conv_error_{time.time_ns()}.pdf")
+                    write_message_pdf(error_pdf, [f"Error converting file: {name}", f"Error: {str(read_err)}"])
                     temp_to_cleanup.append(error_pdf)
-                    merger.append(error_pdf)
-                    print(f"Conversion error for {safe_name}:", conv_err)
+                    readers[path] = PdfReader(error_pdf)
+                    print(f"Error reading {name}:", read_err)
+                outlines[path] = pdf_outline_tree(readers[path])
+            start = len(merger.pages)
+            merger.append(readers[path], import_outline=False)
+            return start, outlines[path]
+
+        outline = []
+        for (section_name, file_keys), divider_fp in zip(sections, dividers):
+            # One bookmark per checklist section, pointing at its divider page,
+            # with each input's own bookmarks nested under it
+            start, _ = append_pdf(divider_fp)
+            section_entry = {'title': section_name, 'page': start, 'children': []}
+            outline.append(section_entry)
+            for file_key in file_keys:
+                if file_key in message_pdfs:
+                    append_pdf(message_pdfs[file_key])
+                elif file_key in uploads:
+                    upload = uploads[file_key]
+                    start, file_outline = append_pdf(
+                        upload['path'] if upload['type'] == 'pdf' else pdf_by_hash[upload['hash']],
+                        name=upload['name'])
+                    section_entry['children'].extend(_offset_outline(file_outline, start))
+        write_outline(merger, outline)
 
         output_filename = f'checklist_combined_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
         output_path = os.path.join(TEMP_DIR, output_filename)
         merger.write(output_path)
         merger.close()
 
-        return send_file(
-            output_path,
-            as_attachment=True,
-            download_name=output_filename,
-            mimetype='application/pdf'
-        )
+        return deliver_output(output_path, output_filename, 'application/pdf')
 
     except Exception as e:
         import traceback
@@ -747,95 +2020,67 @@ def combine_unidoc():
         'ltpc': request.form.get('ltpc', '')
     }
 
-    merger = PdfMerger()
+    # Builds are only kept (and a build id returned) for clients doing incremental rebuilds
+    keep_build = (request.form.get('incremental', '').lower() in ('1', 'true', 'yes')
+                  or bool(request.form.get('previous_build')))
+
     temp_files = []
+    build_id = secrets.token_hex(16)
+    build_dir = os.path.join(TEMP_DIR, f"unidoc_build_{build_id}")
 
     try:
-        # Generate the 3 front pages
-        cover_fp = os.path.join(TEMP_DIR, f"cover_{int(time.time()*1000)}.pdf")
-        info_fp = os.path.join(TEMP_DIR, f"course_info_{int(time.time()*1000)}.pdf")
-        index_fp = os.path.join(TEMP_DIR, f"index_{int(time.time()*1000)}.pdf")
-        
-        create_cover_page(cover_fp)
-        create_course_info_page(course_data, info_fp)
-        
-        # Create index with file names (without extension)
-        file_names = [f.filename.rsplit('.', 1)[0] if '.' in f.filename else f.filename for f in files]
-        create_index_page(file_names, index_fp)
+        os.makedirs(build_dir)
 
-        # Append front pages
-        for fp in [cover_fp, info_fp, index_fp]:
-            merger.append(fp)
-            temp_files.append(fp)
+        # Incremental rebuild: sections whose input is unchanged are copied from the previous output
+        previous = load_unidoc_build(request.form.get('previous_build'))
+        reusable = reusable_section_hashes(previous)
 
-        # Process uploaded files
+        # Create index with file names (without extension)
+        items = []
         for file in files:
+            display_name = file.filename.rsplit('.', 1)[0] if '.' in file.filename else file.filename
             if file.filename == '':
+                items.append({'name': display_name, 'pdf': None, 'hash': None})
                 continue
-                
-            filename = secure_filename(file.filename)
-            temp_path = os.path.join(TEMP_DIR, f"{datetime.now().timestamp()}_{filename}")
-            file.save(temp_path)
-            temp_files.append(temp_path)
-            
-            file_type = get_file_type(filename)
-            
-            try:
-                if file_type == 'pdf':
-                    merger.append(temp_path)
-                else:
-                    converted_pdf = os.path.join(TEMP_DIR, f"converted_{int(time.time()*1000)}.pdf")
-                    
-                    if file_type == 'image':
-                        image_to_pdf(temp_path, converted_pdf)
-                    elif file_type == 'txt':
-                        text_to_pdf(txt_to_text(temp_path), converted_pdf)
-                    elif file_type == 'docx':
-                        docx_to_pdf(temp_path, converted_pdf)
-                    elif file_type == 'pptx':
-                        pptx_to_pdf(temp_path, converted_pdf)
-                    else:
-                        # Unknown type - create placeholder
-                        c = canvas.Canvas(converted_pdf, pagesize=letter)
-                        c.setFont("Helvetica", 12)
-                        c.drawString(60, 750, f"File: {filename}")
-                        c.drawString(60, 730, f"Unsupported file type")
-                        c.save()
-                    
-                    merger.append(converted_pdf)
-                    temp_files.append(converted_pdf)
-                    
-            except Exception as e:
-                # Create error page for this file
-                error_pdf = os.path.join(TEMP_DIR, f"error_{int(time.time()*1000)}.pdf")
-                c = canvas.Canvas(error_pdf, pagesize=letter)
-                c.setFont("Helvetica", 12)
-                c.drawString(60, 750, f"Error processing file: {filename}")
-                c.drawString(60, 730, f"Error: {str(e)}")
-                c.save()
-                merger.append(error_pdf)
-                temp_files.append(error_pdf)
-                print(f"Error processing {filename}: {e}")
+
+            upload = ingest_upload(file)
+            filename = upload['name']
+            temp_files.append(upload['path'])
+
+            file_hash = upload['hash']
+            if file_hash in reusable:
+                items.append({'name': display_name, 'pdf': None, 'hash': file_hash})
+                continue
+
+            pdf_path, ok = pdf_for_input(upload['path'], upload['type'], filename, temp_files)
+            # Error pages carry no hash so a later build never reuses them
+            items.append({'name': display_name, 'pdf': pdf_path, 'hash': file_hash if ok else None})
 
         # Write final output
         output_filename = f"unidoc_combined_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        output_path = os.path.join(TEMP_DIR, output_filename)
-        merger.write(output_path)
-        merger.close()
-        
-        return send_file(
-            output_path,
-            as_attachment=True,
-            download_name=output_filename,
-            mimetype='application/pdf'
-        )
+        output_path = os.path.join(build_dir, 'unidoc.pdf')
+        manifest = assemble_unidoc(course_data, items, output_path, previous)
+        if not keep_build:
+            return deliver_output(output_path, output_filename, 'application/pdf')
+
+        with open(os.path.join(build_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+        # The build dir copy stays behind as the base for the next incremental build
+        response = app.make_response(deliver_output(output_path, output_filename, 'application/pdf', keep_local=True))
+        response.headers['X-UniDoc-Build-Id'] = build_id
+        return response
 
     except Exception as e:
         import traceback
         print("ERROR in /combine-unidoc:", traceback.format_exc())
+        keep_build = False
         return {'error': str(e), 'details': traceback.format_exc()}, 500
 
     finally:
+        # An inline response already holds the output open, so the dir can go
+        if not keep_build:
+            shutil.rmtree(build_dir, ignore_errors=True)
         for p in temp_files:
             try:
                 if os.path.exists(p):
@@ -843,6 +2088,259 @@ def combine_unidoc():
             except:
                 pass
 
+@app.route('/combine-unidoc-batch', methods=['POST'])
+def combine_unidoc_batch():
+    """Build several UniDocs in one request, converting shared attachments only once.
+
+    Form fields:
+      courses   - JSON list of course metadata blocks, each with a "files" list of
+                  upload field names (the same field may be listed by many courses)
+      delivery  - "zip" (default) returns one ZIP; "links" returns per-course download URLs
+    """
+    if 'courses' not in request.form:
+        return {'error': 'Missing courses'}, 400
+
+    try:
+        courses = json.loads(request.form['courses'])
+    except Exception as e:
+        return {'error': 'Invalid courses JSON', 'details': str(e)}, 400
+
+    if not isinstance(courses, list) or not courses:
+        return {'error': 'courses must be a non-empty list'}, 400
+    if len(courses) > BATCH_MAX_COURSES:
+        return {'error': f'Too many courses (max {BATCH_MAX_COURSES})'}, 400
+    for course in courses:
+        if not isinstance(course, dict):
+            return {'error': 'Each course must be a JSON object'}, 400
+        files = course.get('files', [])
+        if not isinstance(files, list) or not all(isinstance(key, str) for key in files):
+            return {'error': 'Each course "files" must be a list of upload field names'}, 400
+
+    delivery = request.form.get('delivery', 'zip')
+    if delivery not in ('zip', 'links'):
+        return {'error': 'Invalid delivery mode'}, 400
+
+    temp_files = []
+    batch_id = secrets.token_hex(16)
+    batch_dir = os.path.join(TEMP_DIR, f"unidoc_batch_{batch_id}")
+    keep_batch_dir = False
+
+    try:
+        _cleanup_expired_dirs('unidoc_batch_', BATCH_OUTPUT_TTL)
+        os.makedirs(batch_dir)
+
+        # Save every referenced upload once and deduplicate by content hash
+        inputs = {}    # file key -> {'name', 'file', 'hash'} or {'error'}
+        unique = {}    # content hash -> (path, type)
+        for course in courses:
+            for file_key in course.get('files', []):
+                if file_key in inputs:
+                    continue
+                fs = request.files.get(file_key)
+                if fs is None or fs.filename == '':
+                    inputs[file_key] = {'error': f"Missing file for: {file_key}"}
+                    continue
+                upload = ingest_upload(fs) if allowed_file(fs.filename) else None
+                if upload:
+                    temp_files.append(upload['path'])
+                if upload is None or upload['type'] == 'unknown':
+                    inputs[file_key] = {'error': f"File type not allowed: {fs.filename}"}
+                    continue
+
+                file_hash = upload['hash']
+                unique.setdefault(file_hash, (upload['path'], upload['type']))
+                inputs[file_key] = {
+                    'name': fs.filename.rsplit('.', 1)[0] if '.' in fs.filename else fs.filename,
+                    'file': upload['name'],
+                    'hash': file_hash,
+                }
+
+        # Convert each unique non-PDF input once, in parallel
+        pdf_by_hash = {}
+        conversions = {}
+        for file_hash, (path, file_type) in unique.items():
+            if file_type == 'pdf':
+                pdf_by_hash[file_hash] = path
+            else:
+                converted_pdf = os.path.join(TEMP_DIR, f"converted_{file_hash}_{time.time_ns()}.pdf")
+                temp_files.append(converted_pdf)
+                task = (convert_to_pdf_isolated, path, file_type, converted_pdf)
+                conversions[file_hash] = (converted_pdf, task, submit_build_task(*task))
+
+        for file_hash, (converted_pdf, task, future) in conversions.items():
+            try:
+                build_task_result(future, *task)
+                pdf_by_hash[file_hash] = converted_pdf
+            except Exception as e:
+                path = unique[file_hash][0]
+                error_pdf = os.path.join(TEMP_DIR, f"error_{time.time_ns()}.pdf")
+                write_message_pdf(error_pdf, [f"Error processing file: {os.path.basename(path)}", f"Error: {str(e)}"])
+                temp_files.append(error_pdf)
+                pdf_by_hash[file_hash] = error_pdf
+                print(f"Error processing {path}: {e}")
+
+        message_pdfs = {}
+        for file_key, info in inputs.items():
+            if 'error' in info:
+                warn_fp = os.path.join(TEMP_DIR, f"warn_{time.time_ns()}.pdf")
+                write_message_pdf(warn_fp, [info['error']])
+                temp_files.append(warn_fp)
+                message_pdfs[file_key] = warn_fp
+
+        # Assemble every course in parallel
+        builds = []
+        for idx, course in enumerate(courses):
+            course_data = {field: str(course.get(field, '')) for field in
+                           ('program', 'code', 'coordinator', 'name', 'faculty', 'ltpc')}
+            items = []
+            for file_key in course.get('files', []):
+                info = inputs[file_key]
+                if 'error' in info:
+                    items.append({'name': file_key, 'pdf': message_pdfs[file_key]})
+                else:
+                    items.append({'name': info['name'], 'pdf': pdf_by_hash[info['hash']]})
+
+            label = secure_filename(course_data['code'] or course_data['name']) or 'course'
+            output_filename = f"{idx + 1:02d}_unidoc_{label}.pdf"
+            output_path = os.path.join(batch_dir, output_filename)
+            task = (assemble_unidoc, course_data, items, output_path)
+            builds.append((course_data, output_filename, task, submit_build_task(*task)))
+
+        results = []
+        errors = []
+        for course_data, output_filename, task, future in builds:
+            try:
+                build_task_result(future, *task)
+                results.append((course_data, output_filename))
+            except Exception as e:
+                errors.append({'code': course_data['code'], 'name': course_data['name'], 'error': str(e)})
+                print(f"Error building {output_filename}: {e}")
+
+        if delivery == 'links':
+            store = get_artifact_store()
+            inline = store.name == 'inline'
+            # Inline links are served from batch_dir until BATCH_OUTPUT_TTL; other stores take a copy
+            keep_batch_dir = inline
+            return {
+                'batch_id': batch_id,
+                'expires_in': BATCH_OUTPUT_TTL if inline else store.ttl,
+                'courses': [{
+                    'code': course_data['code'],
+                    'name': course_data['name'],
+                    'filename': output_filename,
+                    'url': url_for('download_batch_output', batch_id=batch_id,
+                                   filename=output_filename, _external=True) if inline else
+                           store.put(os.path.join(batch_dir, output_filename), output_filename, 'application/pdf'),
+                } for course_data, output_filename in results],
+                'errors': errors,
+            }
+
+        zip_filename = f"unidoc_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        zip_path = os.path.join(batch_dir, zip_filename)
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zf:
+            for _, output_filename in results:
+                zf.write(os.path.join(batch_dir, output_filename), output_filename)
+            if errors:
+                zf.writestr('errors.json', json.dumps(errors, indent=2))
+
+        return deliver_output(zip_path, zip_filename, 'application/zip')
+
+    except Exception as e:
+        import traceback
+        print("ERROR in /combine-unidoc-batch:", traceback.format_exc())
+        return {'error': str(e), 'details': traceback.format_exc()}, 500
+
+    finally:
+        for p in temp_files:
+            try:
+                if os.path.exists(p):
+                    os.remove(p)
+            except Exception:
+                pass
+        # An inline ZIP response already holds the file open, so it can be unlinked here
+        if not keep_batch_dir:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+@app.route('/combine-unidoc-batch/<batch_id>/<filename>', methods=['GET'])
+def download_batch_output(batch_id, filename):
+    """Download one course file produced by /combine-unidoc-batch (links delivery)"""
+    if not re.fullmatch(r'[0-9a-f]{32}', batch_id) or filename != secure_filename(filename):
+        return {'error': 'Not found'}, 404
+
+    batch_dir = os.path.join(TEMP_DIR, f"unidoc_batch_{batch_id}")
+    output_path = os.path.join(batch_dir, filename)
+    try:
+        expired = os.path.getmtime(batch_dir) < time.time() - BATCH_OUTPUT_TTL
+    except OSError:
+        expired = True
+    if expired or not os.path.isfile(output_path):
+        return {'error': 'Not found or expired'}, 404
+
+    return send_file(
+        output_path,
+        as_attachment=True,
+        download_name=filename,
+        mimetype='application/pdf'
+    )
+
+@app.route('/artifacts/<token>/<filename>', methods=['GET'])
+def download_artifact(token, filename):
+    """Serve an output kept by the local artifact store (signed, expiring URL)"""
+    store = get_artifact_store()
+    if store.name != 'local' or not re.fullmatch(r'[0-9a-f]{32}', token) or filename != secure_filename(filename):
+        return {'error': 'Not found'}, 404
+
+    path = store.open(token, filename, request.args.get('expires'), request.args.get('sig'))
+    if path is None:
+        return {'error': 'Not found or expired'}, 404
+
+    return send_file(path, as_attachment=True, download_name=filename)
+
+@app.route('/preview', methods=['POST'])
+def preview_file():
+    """Return a small PNG thumbnail of the first page of an uploaded file"""
+    fs = request.files.get('file')
+    if fs is None or fs.filename == '':
+        return {'error': 'No file uploaded'}, 400
+    if not allowed_file(fs.filename):
+        return {'error': f'File type not allowed: {fs.filename}'}, 400
+
+    try:
+        size = int(request.args.get('size', PREVIEW_DEFAULT_SIZE))
+    except ValueError:
+        return {'error': 'Invalid size'}, 400
+    size = max(16, min(size, PREVIEW_MAX_SIZE))
+
+    upload = ingest_upload(fs)
+    filename = upload['name']
+    file_type = upload['type']
+    temp_path = upload['path']
+
+    try:
+        cache_key = (upload['hash'], file_type, size)
+        png = _preview_cache_get(cache_key)
+        if png is None:
+            png = render_preview(temp_path, file_type, size)
+            if png is None:
+                return {'error': 'No preview available for this file'}, 415
+            _preview_cache_put(cache_key, png)
+
+        response = send_file(io.BytesIO(png), mimetype='image/png')
+        response.headers['Cache-Control'] = 'private, max-age=3600'
+        response.headers['ETag'] = cache_key[0][:32]
+        return response
+
+    except Exception as e:
+        print(f"Preview error for {filename}: {e}")
+        return {'error': str(e)}, 500
+
+    finally:
+        try:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        except Exception:
+            pass
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -858,6 +2356,8 @@ def index():
             '/combine': 'POST - Combine multiple files (preserves PDF formatting)',
             '/combine-checklist': 'POST - Combine files with divider pages',
             '/combine-unidoc': 'POST - Create UniDoc with cover, info, and index pages',
+            '/combine-unidoc-batch': 'POST - Build many UniDocs in one request (ZIP or download links)',
+            '/preview': 'POST - First-page thumbnail (PNG) for a single file',
             '/health': 'GET - Health check'
         },
         'supported_formats': list(ALLOWED_EXTENSIONS),
@@ -0,0 +1,141 @@
+"""PPTX-to-PDF rendering benchmark.
+
+Generates a synthetic lecture deck (titles, bullet text, JPEG and PNG
+pictures, a table every few slides) and times pptx_to_pdf with each
+available renderer against the original text-only platypus conversion.
+
+    python bench_pptx.py --slides 200
+    python bench_pptx.py --slides 200 --text-only
+    python bench_pptx.py --deck lecture.pptx --repeat 3
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+from pptx import Presentation
+from pptx.util import Inches
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+
+from app import pptx_to_pdf, find_libreoffice
+
+
+def platypus_pptx_to_pdf(pptx_path, output_pdf):
+    """The original pptx_to_pdf (text only, one platypus story), kept as the baseline"""
+    doc = SimpleDocTemplate(output_pdf, pagesize=letter)
+    story = []
+    styles = getSampleStyleSheet()
+
+    slide_title_style = ParagraphStyle(
+        'SlideTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        textColor='#2c3e50',
+        spaceAfter=12,
+        alignment=1
+    )
+
+    prs = Presentation(pptx_path)
+
+    for slide_num, slide in enumerate(prs.slides, 1):
+        story.append(Paragraph(f"Slide {slide_num}", slide_title_style))
+        story.append(Spacer(1, 0.2 * inch))
+
+        for shape in slide.shapes:
+            if hasattr(shape, "text") and shape.text.strip():
+                story.append(Paragraph(shape.text, styles['Normal']))
+                story.append(Spacer(1, 0.1 * inch))
+
+        if slide_num < len(prs.slides):
+            story.append(PageBreak())
+
+    doc.build(story)
+
+
+def _image_bytes(fmt, color, size=(640, 480)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, format=fmt)
+    buf.seek(0)
+    return buf
+
+
+def make_deck(path, slides, text_only=False):
+    """Write a synthetic deck with a mix of text, pictures and tables"""
+    prs = Presentation()
+    title_layout = prs.slide_layouts[1]
+    blank_layout = prs.slide_layouts[5]
+    for n in range(slides):
+        if n % 2 == 0 or text_only:
+            slide = prs.slides.add_slide(title_layout)
+            slide.shapes.title.text = f"Lecture topic {n}: overview"
+            body = slide.placeholders[1].text_frame
+            body.text = "First bullet point with some explanatory text that wraps across the line width"
+            for level in range(1, 4):
+                p = body.add_paragraph()
+                p.text = f"Sub point {level}: detail about topic {n}"
+                p.level = level % 3
+        else:
+            slide = prs.slides.add_slide(blank_layout)
+            slide.shapes.title.text = f"Figure {n}"
+            # A handful of distinct images, repeated across slides like real decks
+            fmt = 'JPEG' if n % 10 != 1 else 'PNG'
+            color = ((n * 37) % 256, (n * 91) % 256, (n * 53) % 256) if n % 7 == 0 else (40, 90, 160)
+            slide.shapes.add_picture(_image_bytes(fmt, color), Inches(1), Inches(1.8), width=Inches(5))
+            if n % 5 == 0:
+                table = slide.shapes.add_table(3, 3, Inches(6.2), Inches(1.8), Inches(3.5), Inches(1.5)).table
+                for r in range(3):
+                    for col in range(3):
+                        table.cell(r, col).text = f"R{r}C{col}"
+    prs.save(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PPTX-to-PDF conversion")
+    parser.add_argument('--slides', type=int, default=200, help="Slides in the synthetic deck (default: 200)")
+    parser.add_argument('--text-only', action='store_true', help="Synthetic deck without pictures or tables")
+    parser.add_argument('--deck', help="Benchmark an existing .pptx instead of a synthetic one")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per renderer; the best time is reported")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        deck = args.deck
+        if not deck:
+            deck = os.path.join(tmp, 'deck.pptx')
+            t = time.time()
+            make_deck(deck, args.slides, args.text_only)
+            print(f"📝 Generated {args.slides}-slide deck in {time.time() - t:.2f}s")
+        slides = len(Presentation(deck).slides)
+
+        renderers = [
+            ('platypus', platypus_pptx_to_pdf),
+            ('fast', lambda src, out: pptx_to_pdf(src, out, renderer='fast')),
+        ]
+        if find_libreoffice():
+            renderers.append(('libreoffice', lambda src, out: pptx_to_pdf(src, out, renderer='libreoffice')))
+        else:
+            print("⚠️ LibreOffice not found, skipping the libreoffice renderer")
+
+        print(f"{'renderer':<12} {'seconds':>8} {'slides/s':>9} {'size (KB)':>10} {'speedup':>8}")
+        baseline = None
+        for name, convert in renderers:
+            output = os.path.join(tmp, f"{name}.pdf")
+            best = None
+            for _ in range(max(1, args.repeat)):
+                t = time.time()
+                convert(deck, output)
+                elapsed = time.time() - t
+                best = elapsed if best is None else min(best, elapsed)
+            baseline = baseline or best
+            print(f"{name:<12} {best:8.2f} {slides / best:9.1f} "
+                  f"{os.path.getsize(output) / 1024:10.1f} {baseline / best:7.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,311 @@
+"""Offline bulk UniDoc builder.
+
+Builds one UniDoc PDF per course folder using the same cover/info/index pages,
+converters and merge logic as the /combine-unidoc endpoint.
+
+    python build_unidocs.py COURSES_DIR --manifest manifest.json --out build/
+
+The manifest maps each course folder (relative to COURSES_DIR) to its metadata:
+
+    {
+      "CSE/CS101": {
+        "program": "B.Tech CSE Sem 3", "code": "CS101", "name": "Data Structures",
+        "coordinator": "...", "faculty": "...", "ltpc": "3-0-2",
+        "files": ["syllabus.pdf", "lesson_plan.docx", "../../common/calendar.pdf"]
+      }
+    }
+
+"files" is optional and relative to the course folder; without it every
+supported file directly inside the folder is used, sorted by name.
+
+Each unique input (by content hash) is converted once per run and kept under
+OUT/.converted, and courses whose metadata and inputs are unchanged since the
+last run are skipped, so an interrupted build can simply be re-run. Changed
+courses are rebuilt incrementally: sections whose input is unchanged are
+copied from the previous output.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from werkzeug.utils import secure_filename
+
+from app import (
+    allowed_file, get_file_type, file_sha256, convert_to_pdf_isolated,
+    write_message_pdf, assemble_unidoc, reusable_section_hashes
+)
+
+COURSE_FIELDS = ('program', 'code', 'name', 'coordinator', 'faculty', 'ltpc')
+STATE_FILE = '.build_state.json'
+CONVERTED_DIR = '.converted'
+
+
+def load_manifest(manifest_path):
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict):
+        raise ValueError("Manifest must be a JSON object mapping course folders to metadata")
+    return manifest
+
+
+def resolve_course_inputs(root, folder, meta):
+    """Return the ordered list of input dicts for one course"""
+    course_dir = os.path.join(root, folder)
+    if 'files' in meta:
+        names = meta['files']
+    elif os.path.isdir(course_dir):
+        names = sorted(
+            n for n in os.listdir(course_dir)
+            if os.path.isfile(os.path.join(course_dir, n)) and allowed_file(n)
+        )
+    else:
+        names = []
+
+    inputs = []
+    for name in names:
+        path = os.path.normpath(os.path.join(course_dir, name))
+        base = os.path.basename(name)
+        inputs.append({
+            'path': path,
+            'name': base.rsplit('.', 1)[0] if '.' in base else base,
+            'type': get_file_type(base) if allowed_file(base) else 'unknown',
+            'exists': os.path.isfile(path),
+        })
+    return inputs
+
+
+def course_fingerprint(course_data, inputs, hashes):
+    """Hash of everything that affects a course's output"""
+    payload = {
+        'course': course_data,
+        'inputs': [(i['name'], i['type'], hashes.get(i['path'])) for i in inputs],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def output_name(folder):
+    return secure_filename(folder.strip('/\\').replace('/', '_').replace('\\', '_')) + '.pdf'
+
+
+def load_state(out_dir):
+    try:
+        with open(os.path.join(out_dir, STATE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(out_dir, state):
+    tmp_path = os.path.join(out_dir, STATE_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(out_dir, STATE_FILE))
+
+
+# Worker functions (run in the process pool)
+def _assemble_worker(course_data, items, output_path, previous):
+    """Assemble one course; items may carry an 'error' instead of a PDF. Returns (elapsed seconds, manifest)"""
+    start = time.time()
+    temp_files = []
+    try:
+        for item in items:
+            if item.get('error'):
+                error_pdf = os.path.join(tempfile.gettempdir(), f"error_{time.time_ns()}.pdf")
+                write_message_pdf(error_pdf, [f"Error processing file: {item['file']}", f"Error: {item['error']}"])
+                temp_files.append(error_pdf)
+                item['pdf'] = error_pdf
+
+        tmp_output = output_path + '.partial'
+        manifest = assemble_unidoc(course_data, items, tmp_output, previous)
+        os.replace(tmp_output, output_path)
+    finally:
+        for p in temp_files:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+    return time.time() - start, manifest
+
+
+def build_all(root, manifest, out_dir, workers, force=False):
+    os.makedirs(os.path.join(out_dir, CONVERTED_DIR), exist_ok=True)
+    timings = {}
+    run_start = time.time()
+
+    # 1. Resolve inputs for every course
+    courses = {}
+    for folder, meta in manifest.items():
+        course_data = {field: str(meta.get(field, '')) for field in COURSE_FIELDS}
+        courses[folder] = {
+            'data': course_data,
+            'inputs': resolve_course_inputs(root, folder, meta),
+            'output': os.path.join(out_dir, output_name(folder)),
+        }
+
+    # 2. Hash every unique input once
+    t = time.time()
+    unique_paths = sorted({i['path'] for c in courses.values() for i in c['inputs'] if i['exists']})
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        hashes = dict(zip(unique_paths, pool.map(file_sha256, unique_paths)))
+    timings['hash'] = time.time() - t
+
+    # 3. Decide which courses need rebuilding
+    state = load_state(out_dir)
+    pending = []
+    skipped = []
+    for folder, course in courses.items():
+        course['fingerprint'] = course_fingerprint(course['data'], course['inputs'], hashes)
+        previous = state.get(folder, {})
+        if (not force and previous.get('fingerprint') == course['fingerprint']
+                and os.path.exists(course['output'])):
+            skipped.append(folder)
+        else:
+            pending.append(folder)
+            # Changed course: unchanged sections are copied from the previous output
+            if not force and previous.get('manifest') and os.path.exists(course['output']):
+                course['previous'] = {'pdf': course['output'], 'manifest': previous['manifest']}
+            else:
+                course['previous'] = None
+
+    # 4. Convert each unique non-PDF input once
+    t = time.time()
+    converted = {}       # content hash -> converted PDF path
+    conversion_errors = {}
+    to_convert = {}
+    references = 0
+    for folder in pending:
+        reusable = reusable_section_hashes(courses[folder]['previous'])
+        for i in courses[folder]['inputs']:
+            if not i['exists'] or i['type'] == 'pdf' or hashes[i['path']] in reusable:
+                continue
+            references += 1
+            file_hash = hashes[i['path']]
+            dest = os.path.join(out_dir, CONVERTED_DIR, f"{file_hash}.pdf")
+            if os.path.exists(dest):
+                converted[file_hash] = dest
+            elif file_hash not in to_convert:
+                to_convert[file_hash] = (i['path'], i['type'], dest)
+
+    conversion_times = []
+    if to_convert:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(convert_to_pdf_isolated, src, ftype, dest): (file_hash, src, dest)
+                for file_hash, (src, ftype, dest) in to_convert.items()
+            }
+            for future in as_completed(futures):
+                file_hash, src, dest = futures[future]
+                try:
+                    conversion_times.append((future.result(), src))
+                    converted[file_hash] = dest
+                    print(f"✅ Converted {src}")
+                except Exception as e:
+                    conversion_errors[file_hash] = str(e)
+                    print(f"❌ Conversion failed for {src}: {e}")
+    timings['convert'] = time.time() - t
+
+    # 5. Assemble pending courses in parallel
+    t = time.time()
+    course_times = []
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for folder in pending:
+            course = courses[folder]
+            items = []
+            for i in course['inputs']:
+                item = {'name': i['name'], 'file': os.path.basename(i['path']), 'pdf': None,
+                        'hash': hashes.get(i['path'])}
+                if not i['exists']:
+                    item['error'] = 'File not found'
+                elif i['type'] == 'pdf':
+                    item['pdf'] = i['path']
+                elif item['hash'] in converted:
+                    item['pdf'] = converted[item['hash']]
+                elif item['hash'] not in reusable_section_hashes(course['previous']):
+                    item['error'] = conversion_errors.get(item['hash'], 'Conversion failed')
+                if item.get('error'):
+                    item['hash'] = None
+                items.append(item)
+            future = pool.submit(_assemble_worker, course['data'], items, course['output'], course['previous'])
+            futures[future] = folder
+
+        for future in as_completed(futures):
+            folder = futures[future]
+            try:
+                elapsed, manifest = future.result()
+                course_times.append((elapsed, folder))
+                state[folder] = {
+                    'fingerprint': courses[folder]['fingerprint'],
+                    'output': courses[folder]['output'],
+                    'manifest': manifest,
+                }
+                save_state(out_dir, state)
+                print(f"✅ Built {folder}")
+            except Exception as e:
+                failed.append((folder, str(e)))
+                print(f"❌ Build failed for {folder}: {e}")
+    timings['assemble'] = time.time() - t
+    timings['total'] = time.time() - run_start
+
+    print_summary(courses, pending, skipped, failed, timings, converted, conversion_errors, references,
+                  conversion_times, course_times)
+    return not failed
+
+
+def print_summary(courses, pending, skipped, failed, timings, converted, conversion_errors, references,
+                  conversion_times, course_times):
+    print("=" * 60)
+    print("UniDoc bulk build summary")
+    print("=" * 60)
+    print(f"Courses:      {len(courses)} total, {len(pending) - len(failed)} built, "
+          f"{len(skipped)} unchanged (skipped), {len(failed)} failed")
+    # conversion_times has one entry per successful conversion this run; the rest of converted were cached
+    print(f"Conversions:  {len(conversion_times)} unique files converted, {len(conversion_errors)} failed, "
+          f"{len(converted) - len(conversion_times)} reused from {CONVERTED_DIR} "
+          f"({references} references in rebuilt courses)")
+    print(f"Hashing:      {timings['hash']:.2f}s")
+    print(f"Converting:   {timings['convert']:.2f}s")
+    print(f"Assembling:   {timings['assemble']:.2f}s")
+    print(f"Total:        {timings['total']:.2f}s")
+
+    if conversion_times:
+        print("\nSlowest conversions:")
+        for elapsed, src in sorted(conversion_times, reverse=True)[:5]:
+            print(f"  {elapsed:7.2f}s  {src}")
+    if course_times:
+        print("\nSlowest courses:")
+        for elapsed, folder in sorted(course_times, reverse=True)[:5]:
+            print(f"  {elapsed:7.2f}s  {folder}")
+    for folder, error in failed:
+        print(f"\n❌ {folder}: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build UniDoc course files for a whole directory tree")
+    parser.add_argument('root', help="Directory containing the course folders")
+    parser.add_argument('--manifest', help="Course metadata JSON (default: ROOT/manifest.json)")
+    parser.add_argument('--out', default='unidoc_build', help="Output directory (default: ./unidoc_build)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Parallel worker processes (default: CPU count)")
+    parser.add_argument('--force', action='store_true', help="Rebuild every course, even if unchanged")
+    args = parser.parse_args(argv)
+
+    manifest_path = args.manifest or os.path.join(args.root, 'manifest.json')
+    try:
+        manifest = load_manifest(manifest_path)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read manifest {manifest_path}: {e}")
+        return 2
+
+    ok = build_all(args.root, manifest, args.out, max(1, args.workers), args.force)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,7 +19,7 @@ function uploadWithProgress(url, formData, mode, onComplete, onError) {
 
 
    // ==================== VERSION CONTROL ====================
-const APP_VERSION = 'v4.1.2';
+const APP_VERSION = 'v4.1.4';
 console.log(`📱 File Combiner Pro ${APP_VERSION}`);
 
 // Service Worker registration with update handling
@@ -153,7 +153,7 @@ function showUpdateBanner() {
       progressText.textContent = 'Complete! ✓';
       
       const blob = xhr.response;
-      onComplete(blob);
+      onComplete(blob, xhr);
       
       setTimeout(() => {
         progressContainer.classList.remove('active');
@@ -195,6 +195,8 @@ let checklists = [];
 let checklistIdCounter = 0;
 // Store UniDoc files by data-key (string) -> File or Array<File>
 const uniDocFiles = new Map();
+// Id of the last UniDoc build; sent back so the server only rebuilds changed sections
+let lastUniDocBuildId = null;
 
 // ---------- MODE SWITCHING ----------
 document.querySelectorAll('.mode-btn').forEach(btn => {
@@ -285,7 +287,7 @@ function updateStandardFilesList() {
     return `
       <div class="file-item">
         <div class="file-info">
-          <div class="file-icon ${iconClass}">${ext.toUpperCase()}</div>
+          <div class="file-icon ${iconClass}" data-preview-index="${index}">${ext.toUpperCase()}</div>
           <div>
             <div class="file-name">${file.name}</div>
             <div style="font-size: 0.9em; color: #999;">${size}</div>
@@ -295,6 +297,8 @@ function updateStandardFilesList() {
       </div>
     `;
   }).join('');
+
+  attachPreviews(filesContainer, standardFiles);
 }
 
 function removeStandardFile(index) {
@@ -399,6 +403,8 @@ function renderChecklists() {
     area.addEventListener('drop', (e) => {
       e.preventDefault(); area.classList.remove('drag-over'); handleChecklistFiles(checklist.id, e.dataTransfer.files);
     });
+
+    attachPreviews(document.getElementById(`checklistFiles_${checklist.id}`), checklist.files);
   });
 }
 
@@ -413,7 +419,7 @@ function renderChecklistFiles(checklist) {
     return `
       <div class="file-item">
         <div class="file-info">
-          <div class="file-icon ${iconClass}">${ext.toUpperCase()}</div>
+          <div class="file-icon ${iconClass}" data-preview-index="${index}">${ext.toUpperCase()}</div>
           <div>
             <div class="file-name">${escapeHtml(file.name)}</div>
             <div style="font-size: 0.9em; color: #999;">${size}</div>
@@ -618,7 +624,17 @@ function formatFileSize(bytes) {
   return Math.round(bytes / Math.pow(k, i) * 100) / 100 + ' ' + sizes[i];
 }
 
-function downloadFile(blob, filename) {
+async function downloadFile(blob, filename) {
+  // With an object-storage backend the server answers with a short-lived link instead of the file
+  if (blob.type === 'application/json') {
+    const info = JSON.parse(await blob.text());
+    if (info.download_url) {
+      const a = document.createElement('a');
+      a.href = info.download_url; a.download = info.filename || filename; document.body.appendChild(a); a.click();
+      document.body.removeChild(a);
+      return;
+    }
+  }
   const url = window.URL.createObjectURL(blob);
   const a = document.createElement('a');
   a.href = url; a.download = filename; document.body.appendChild(a); a.click();
@@ -637,6 +653,42 @@ function showChecklistStatus(message, type) {
 }
 function hideChecklistStatus() { checklistStatusMessage.classList.remove('active'); }
 
+// ---------- FILE PREVIEWS ----------
+// File -> Promise<string|null> (object URL of the thumbnail), so re-renders never refetch
+const previewCache = new WeakMap();
+
+function fetchPreview(file) {
+  if (!previewCache.has(file)) {
+    let promise;
+    if (file.type.startsWith('image/')) {
+      // Images can be shown straight from the local file, no round trip needed
+      promise = Promise.resolve(URL.createObjectURL(file));
+    } else {
+      const formData = new FormData();
+      formData.append('file', file);
+      promise = fetchWithTimeout(`${API_BASE}/preview?size=96`, { method: 'POST', body: formData }, 30000)
+        .then(res => (res.ok ? res.blob() : null))
+        .then(blob => (blob ? URL.createObjectURL(blob) : null))
+        .catch(() => null);
+    }
+    previewCache.set(file, promise);
+  }
+  return previewCache.get(file);
+}
+
+function attachPreviews(container, files) {
+  if (!container) return;
+  container.querySelectorAll('.file-icon[data-preview-index]').forEach(icon => {
+    const file = files[Number(icon.dataset.previewIndex)];
+    if (!file) return;
+    fetchPreview(file).then(url => {
+      if (!url || !icon.isConnected) return;
+      icon.innerHTML = `<img class="file-thumb" src="${url}" alt="">`;
+      icon.classList.add('has-thumb');
+    });
+  });
+}
+
 // Simple escaping to avoid injected HTML from file names
 function escapeHtml(unsafe) {
   return String(unsafe).replace(/[&<>"']/g, (c) => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": "&#39;" })[c]);
@@ -726,12 +778,16 @@ if (combineUniDocBtn) {
       formData.append('name', document.querySelector('#nameInput')?.value || '');
       formData.append('faculty', document.querySelector('#facultyInput')?.value || '');
       formData.append('ltpc', document.querySelector('#ltpcInput')?.value || '');
+      // Opt in to incremental builds: the server keeps this build so the next one reuses unchanged sections
+      formData.append('incremental', '1');
+      if (lastUniDocBuildId) formData.append('previous_build', lastUniDocBuildId);
 
       uploadWithProgress(
         `${API_BASE}/combine-unidoc`,
         formData,
         'unidoc',
-        (blob) => {
+        (blob, xhr) => {
+          lastUniDocBuildId = xhr.getResponseHeader('X-UniDoc-Build-Id') || null;
           downloadFile(blob, `unidoc_combined_${Date.now()}.pdf`);
           showUnidocStatus('✓ UniDocs merged successfully!', 'success');
           combineUniDocBtn.disabled = false;
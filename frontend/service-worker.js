@@ -1,6 +1,6 @@
 // ==================== UPDATED SERVICE WORKER ====================
 // Change this version number EVERY time you deploy
-const CACHE_VERSION = 'v4.1.2'; // ← Increment this with each update!
+const CACHE_VERSION = 'v4.1.4'; // ← Increment this with each update!
 const CACHE_NAME = `file-combiner-${CACHE_VERSION}`;
 
 const urlsToCache = [